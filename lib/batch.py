@@ -0,0 +1,248 @@
+"""This is a vectorized engine that plays many games in lockstep.
+
+It's meant for Monte Carlo evaluation.  BatchGame keeps B boards in a
+``(B, total_squares)`` int8 array and applies the rules of model.Game to
+all of them at once using NumPy.  The results match model.Game exactly.
+
+Since the level and the special squares only depend on the move count,
+and every game in the batch moves at the same time, they're the same
+across the whole batch.  Only the players differ, since each game has
+its own first player.
+
+This module requires NumPy.
+
+"""
+
+import numpy
+
+from model import (BLANK, RED, BLUE, SIZE, TICTACTOE_VALUE,
+                   SPECIAL_TICTACTOE_VALUE, get_rules)
+
+__docformat__ = 'restructuredtext'
+
+EMPTY_CODE = 0
+RED_CODE = 1
+BLUE_CODE = 2
+OWNER_BITS = 3
+SPECIAL_FLAG = 4
+CODES = {RED: RED_CODE, BLUE: BLUE_CODE}
+PLAYERS = {EMPTY_CODE: BLANK, RED_CODE: RED, BLUE_CODE: BLUE}
+
+
+def get_paths_by_level(rules):
+    """Return ``(paths_by_level, through_by_level)`` for the given Rules.
+
+    paths_by_level
+      This is a list with an entry per level.  It's an ``(L, size)``
+      array of the bits in the L winning paths whose highest z is that
+      level.  Only those can be completed by a move on that level.
+
+    through_by_level
+      This is a list with an entry per level.  It's a
+      ``(total_squares, L)`` bool array that says whether each bit is
+      on each of the paths in paths_by_level.
+
+    They're only calculated once per board size.
+
+    """
+    if rules.size in get_paths_by_level.cache:
+        return get_paths_by_level.cache[rules.size]
+    paths_by_level = [[] for z in rules.range_size]
+    for path in rules.winning_paths:
+        (x_, y_, z_) = path[0]
+        paths_by_level[z_].append([rules.xyz_to_bit(xyz) for xyz in path])
+    through_by_level = []
+    for z in rules.range_size:
+        paths = numpy.array(paths_by_level[z], dtype=numpy.intp)
+        paths_by_level[z] = paths
+        through = numpy.zeros((rules.total_squares, len(paths)), dtype=bool)
+        for (i, path) in enumerate(paths):
+            through[path, i] = True
+        through_by_level.append(through)
+    get_paths_by_level.cache[rules.size] = (paths_by_level, through_by_level)
+    return (paths_by_level, through_by_level)
+
+get_paths_by_level.cache = {}
+
+
+class BatchGame:
+
+    """This is B games being played in lockstep.
+
+    The following attributes are used:
+
+    size, rules
+      These are just like in model.Game.
+
+    boards
+      This is a ``(B, rules.total_squares)`` int8 array.  Each entry is
+      EMPTY_CODE, RED_CODE, or BLUE_CODE, or'd with SPECIAL_FLAG if the
+      square is special.  The bits are numbered by
+      ``model.Rules.xyz_to_bit``.
+
+    first_players
+      This is a ``(B,)`` int8 array of RED_CODE or BLUE_CODE.
+
+    scores
+      This is a ``(B, 2)`` int32 array.  Column 0 is red's score, and
+      column 1 is blue's.
+
+    move_count
+      This starts at 0 and ends at ``rules.total_squares``.  It's the
+      same for every game.
+
+    history
+      This is a list of the ``(B,)`` arrays of bits passed to move.
+      Replaying column i through model.Game reproduces game i.
+
+    """
+
+    def __init__(self, count, first_players=None, random_state=None,
+                 size=SIZE):
+        """Start count games.
+
+        first_players
+          If None, I'll pick randomly for each game.  Otherwise, this
+          is a sequence of RED and BLUE.
+
+        random_state
+          This is a numpy.random.RandomState used for picking the first
+          players and by play_randomly.  If None, I'll make one.
+
+        size
+          This is the width of the boards.
+
+        """
+        self.size = size
+        self.rules = get_rules(size)
+        (self._paths_by_level,
+         self._through_by_level) = get_paths_by_level(self.rules)
+        if random_state is None:
+            random_state = numpy.random.RandomState()
+        self.random_state = random_state
+        self.count = count
+        if first_players is None:
+            self.first_players = random_state.randint(
+                RED_CODE, BLUE_CODE + 1, count).astype(numpy.int8)
+        else:
+            self.first_players = numpy.array(
+                [CODES[player] for player in first_players], dtype=numpy.int8)
+        self.boards = numpy.zeros((count, self.rules.total_squares),
+                                  dtype=numpy.int8)
+        self.scores = numpy.zeros((count, 2), dtype=numpy.int32)
+        self.move_count = 0
+        self.history = []
+        self._games = numpy.arange(count)
+
+    def done():
+        doc = """Are the games done?"""
+
+        def fget(self):
+            return self.move_count == self.rules.total_squares
+
+        return locals()
+    done = property(**done())
+
+    def current_level():
+        doc = """What level are we on?"""
+
+        def fget(self):
+            return self.move_count // self.rules.squares_per_level
+
+        return locals()
+    current_level = property(**current_level())
+
+    def current_move_special():
+        doc = """Is the current move special?"""
+
+        def fget(self):
+            return self.rules.special_moves[self.move_count]
+
+        return locals()
+    current_move_special = property(**current_move_special())
+
+    def current_players():
+        doc = """Get a ``(B,)`` array of whose turn it is in each game."""
+
+        def fget(self):
+            if self.move_count % 2:
+                return (RED_CODE + BLUE_CODE) - self.first_players
+            return self.first_players
+
+        return locals()
+    current_players = property(**current_players())
+
+    def winners():
+        doc = """Get a ``(B,)`` array of RED_CODE, BLUE_CODE, or EMPTY_CODE.
+
+        EMPTY_CODE means it's a tie.
+
+        """
+
+        def fget(self):
+            difference = self.scores[:, 0] - self.scores[:, 1]
+            winners = numpy.zeros(self.count, dtype=numpy.int8)
+            winners[difference > 0] = RED_CODE
+            winners[difference < 0] = BLUE_CODE
+            return winners
+
+        return locals()
+    winners = property(**winners())
+
+    def legal_moves(self):
+        """Return a ``(B, squares_per_level)`` bool array of legal moves.
+
+        Column i is bit ``current_level * squares_per_level + i``.
+
+        """
+        squares_per_level = self.rules.squares_per_level
+        start = self.current_level * squares_per_level
+        return self.boards[:, start:start + squares_per_level] == EMPTY_CODE
+
+    def move(self, bits):
+        """Let the current player in each game pick a square.
+
+        bits is a ``(B,)`` array of bits.  Raise a ValueError if any of
+        them is on the wrong level or already taken.  Return a ``(B,)``
+        array of the points earned.
+
+        """
+        bits = numpy.asarray(bits, dtype=numpy.intp)
+        level = self.current_level
+        squares_per_level = self.rules.squares_per_level
+        start = level * squares_per_level
+        if ((bits < start) | (bits >= start + squares_per_level)).any():
+            raise ValueError("Wrong level")
+        games = self._games
+        if (self.boards[games, bits] != EMPTY_CODE).any():
+            raise ValueError('Square taken')
+        players = self.current_players
+        values = players
+        if self.current_move_special:
+            values = players | SPECIAL_FLAG
+        self.boards[games, bits] = values
+
+        cells = self.boards[:, self._paths_by_level[level]]
+        owned = ((cells & OWNER_BITS) == players[:, None, None]).all(axis=2)
+        owned &= self._through_by_level[level][bits]
+        special = owned & (cells & SPECIAL_FLAG).astype(bool).all(axis=2)
+        points = (owned.sum(axis=1) * TICTACTOE_VALUE +
+                  special.sum(axis=1) *
+                  (SPECIAL_TICTACTOE_VALUE - TICTACTOE_VALUE))
+        self.scores[games, players - 1] += points
+        self.history.append(bits)
+        self.move_count += 1
+        return points
+
+    def random_moves(self):
+        """Return a ``(B,)`` array with a random legal bit for each game."""
+        squares_per_level = self.rules.squares_per_level
+        keys = self.random_state.random_sample((self.count,
+                                                squares_per_level))
+        keys[~self.legal_moves()] = -1
+        return keys.argmax(axis=1) + self.current_level * squares_per_level
+
+    def play_randomly(self):
+        """Finish every game by picking random moves."""
+        while not self.done:
+            self.move(self.random_moves())
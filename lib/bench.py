@@ -0,0 +1,444 @@
+"""This is a micro-benchmark suite for the hot paths.
+
+It covers the model, the dispatcher, the scheduler, and the image
+loader.  It runs headless.  Run it via::
+
+  python run_game.py --bench --save baseline.json
+
+and then, after changing something::
+
+  python run_game.py --bench --compare baseline.json
+
+Each benchmark is timed in a loop that runs for at least MIN_TIME
+seconds, the best of REPEAT loops is kept, and the result is reported
+in microseconds per operation.  Benchmarks that need to set things up
+before every call, such as playing a game before timing its reset,
+only have the calls themselves timed.  Anything that got more than
+``--threshold`` percent slower than the baseline is flagged, and the
+exit status is 1, so this can be used as a regression check.
+
+The benchmarks that need PyGame are skipped if it isn't installed.
+
+"""
+
+from collections import OrderedDict
+from optparse import OptionParser
+import os
+import random
+import sys
+from timeit import default_timer
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from model import RED, SIZE, Game
+from pydispatch import dispatcher, robustapply
+
+__docformat__ = 'restructuredtext'
+
+MIN_TIME = 0.2
+REPEAT = 3
+DEFAULT_THRESHOLD = 10.0
+DISPATCHER_RECEIVERS = (0, 1, 54, 500)
+SCHEDULER_TIMERS = (10, 100, 1000, 10000)
+
+
+class Receiver:
+
+    """This is a receiver that accepts what the model sends."""
+
+    def __init__(self):
+        self.count = 0
+
+    def receive(self, signal, sender, xyzs_included=None):
+        self.count += 1
+
+
+class Sender:
+
+    """This is something to send signals from."""
+
+
+class Timer:
+
+    """This is a scheduler callback that keeps setting itself again.
+
+    With n of these, each n milliseconds apart, exactly one is due on
+    every tick.
+
+    """
+
+    def __init__(self, scheduler, milliseconds):
+        self.scheduler = scheduler
+        self.milliseconds = milliseconds
+
+    def __call__(self):
+        self.scheduler.set_timer(self.milliseconds, self)
+
+
+def get_pygame():
+    """Return the pygame module, with a dummy display, or None.
+
+    Setting the display mode is required for converting images.
+
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    try:
+        import pygame
+    except ImportError:
+        return None
+    if pygame.display.get_surface() is None:
+        pygame.display.init()
+        pygame.display.set_mode((1, 1))
+    return pygame
+
+
+def get_game_xyzs(game):
+    """Return every square, level by level, in a random but repeatable order.
+
+    Playing them in this order is a legal game.
+
+    """
+    rand = random.Random(0)
+    xyzs = []
+    for z in xrange(game.size):
+        level = [(x, y, z) for x in xrange(game.size)
+                 for y in xrange(game.size)]
+        rand.shuffle(level)
+        xyzs.extend(level)
+    return xyzs
+
+
+def bench_game_move(receivers=False):
+    """Play a whole game, level by level, in a random but repeatable order.
+
+    This includes one reset per game; see bench_game_reset.
+
+    receivers
+      If True, connect a receiver to every signal the game sends, the
+      way the views do.
+
+    """
+    game = Game(RED)
+    xyzs = get_game_xyzs(game)
+    receiver = Receiver()
+    if receivers:
+        dispatcher.connect(receiver.receive, sender=game)
+
+    def run():
+        game.reset(RED)
+        for xyz in xyzs:
+            game.move(xyz)
+
+    run.receiver = receiver
+    return (run, len(xyzs))
+
+
+def bench_game_reset(receivers=False):
+    """Reset a game that's been played to the end.
+
+    Only the reset is timed; the game is played again before each one.
+
+    receivers
+      If True, connect a receiver to every square, the way the views
+      do, so that every square sends "SQUARE CHANGED".
+
+    """
+    game = Game(RED)
+    xyzs = get_game_xyzs(game)
+    receiver = Receiver()
+    if receivers:
+        for square in game.board.values():
+            dispatcher.connect(receiver.receive, 'SQUARE CHANGED', square)
+
+    def setup():
+        for xyz in xyzs:
+            game.move(xyz)
+
+    def run():
+        game.reset(RED)
+
+    run.receiver = receiver
+    return (run, 1, setup)
+
+
+def bench_handle_tictactoe(scores):
+    """Look for tic-tac-toes after a move, as ``Game.move`` does.
+
+    scores
+      If True, the move makes at least one tic-tac-toe.  Otherwise, it
+      doesn't, which is the usual case.
+
+    """
+    game = Game(RED)
+    for xyz in get_game_xyzs(game):
+        player = game.current_player
+        before = game.scores[player]
+        game.move(xyz)
+        if (game.scores[player] > before) == scores:
+            break
+    # Take the move back, except for the owners bit, so that the
+    # position is just as _handle_tictactoe sees it during the move.
+    game.undo()
+    game.owners[player] |= 1 << game.rules.xyz_to_bit(xyz)
+    handle_tictactoe = game._handle_tictactoe
+    saved_scores = dict(game.scores)
+
+    def run():
+        handle_tictactoe(xyz)
+        game.scores.update(saved_scores)
+        del game.status[:]
+
+    return (run, 1)
+
+
+def bench_dispatcher_send(receiver_count):
+    """Send a signal to receiver_count receivers."""
+    sender = Sender()
+    receivers = [Receiver() for i in xrange(receiver_count)]
+    for receiver in receivers:
+        dispatcher.connect(receiver.receive, 'BENCH', sender)
+    send = dispatcher.send
+
+    def run():
+        send('BENCH', sender, xyzs_included=[])
+
+    run.receivers = receivers
+    return (run, 1)
+
+
+def bench_robust_apply():
+    """Call a receiver via robustApply with an argument it doesn't take."""
+    receive = Receiver().receive
+    sender = Sender()
+    robust_apply = robustapply.robustApply
+
+    def run():
+        robust_apply(receive, signal='BENCH', sender=sender,
+                     xyzs_included=[], unwanted=None)
+
+    return (run, 1)
+
+
+def bench_direct_call():
+    """Call the same receiver directly, to compare with robustApply."""
+    receive = Receiver().receive
+    sender = Sender()
+
+    def run():
+        receive(signal='BENCH', sender=sender, xyzs_included=[])
+
+    return (run, 1)
+
+
+def bench_scheduler_tick(timer_count):
+    """Tick a scheduler with timer_count timers, one of which is due."""
+    if get_pygame() is None:
+        return None
+    from scheduler import Scheduler, VirtualClock
+    clock = VirtualClock()
+    scheduler = Scheduler(clock)
+    for i in xrange(timer_count):
+        scheduler.set_timer(i + 1, Timer(scheduler, timer_count))
+
+    def run():
+        clock.advance(1)
+        scheduler.tick()
+
+    return (run, 1)
+
+
+def bench_load_image(warm):
+    """Load every image, starting with empty caches unless warm."""
+    if get_pygame() is None:
+        return None
+    import data
+    filenames = data.list_images()
+    load_image = data.load_image
+
+    def reset():
+        load_image.atlas = None
+        load_image.cache = {}
+        load_image.lru = OrderedDict()
+        load_image.lru_bytes = 0
+
+    def run():
+        if not warm:
+            reset()
+        for filename in filenames:
+            load_image(filename)
+
+    reset()
+    run()
+    return (run, len(filenames))
+
+BENCHMARKS = [
+    ('game.move', bench_game_move, ()),
+    ('game.move.receivers', bench_game_move, (True,)),
+    ('game.reset', bench_game_reset, ()),
+    ('game.reset.receivers', bench_game_reset, (True,)),
+    ('game.handle_tictactoe.hit', bench_handle_tictactoe, (True,)),
+    ('game.handle_tictactoe.miss', bench_handle_tictactoe, (False,)),
+] + [
+    ('dispatcher.send.%s' % n, bench_dispatcher_send, (n,))
+    for n in DISPATCHER_RECEIVERS
+] + [
+    ('robustapply.robustApply', bench_robust_apply, ()),
+    ('robustapply.direct', bench_direct_call, ()),
+] + [
+    ('scheduler.tick.%s' % n, bench_scheduler_tick, (n,))
+    for n in SCHEDULER_TIMERS
+] + [
+    ('data.load_image.cold', bench_load_image, (False,)),
+    ('data.load_image.warm', bench_load_image, (True,)),
+]
+
+
+def measure(run, ops, min_time=MIN_TIME, repeat=REPEAT, setup=None):
+    """Return the best time for run, in microseconds per operation.
+
+    run performs ops operations.  I keep doubling the number of calls
+    until a loop takes at least min_time seconds.
+
+    setup
+      If not None, I call this before every call to run, and only time
+      run.
+
+    """
+    number = 1
+    while True:
+        elapsed = time_loop(run, number, setup)
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed
+    for i in xrange(repeat - 1):
+        best = min(best, time_loop(run, number, setup))
+    return best * 1e6 / (number * ops)
+
+
+def time_loop(run, number, setup=None):
+    """Call run number times, and return how long it took in seconds."""
+    if setup is None:
+        start = default_timer()
+        for i in xrange(number):
+            run()
+        return default_timer() - start
+    elapsed = 0.0
+    for i in xrange(number):
+        setup()
+        start = default_timer()
+        run()
+        elapsed += default_timer() - start
+    return elapsed
+
+
+def run_benchmarks(names=None, min_time=MIN_TIME, repeat=REPEAT):
+    """Run the benchmarks and generate ``(name, usec_per_op)`` pairs.
+
+    names
+      If not None, only run benchmarks whose names start with one of
+      these.
+
+    Each factory returns ``(run, ops)``, or ``(run, ops, setup)``, as
+    passed to measure, or None to skip the benchmark.  usec_per_op is
+    None if the benchmark was skipped.
+
+    """
+    for (name, factory, args) in BENCHMARKS:
+        if names and not [prefix for prefix in names
+                          if name.startswith(prefix)]:
+            continue
+        benchmark = factory(*args)
+        if benchmark is None:
+            yield (name, None)
+            continue
+        (run, ops) = benchmark[:2]
+        setup = None
+        if len(benchmark) > 2:
+            setup = benchmark[2]
+        yield (name, measure(run, ops, min_time, repeat, setup))
+
+
+def compare(baseline, name, usec_per_op, threshold=DEFAULT_THRESHOLD):
+    """Compare a result against the baseline.
+
+    Return the change as a percentage, or None if there's nothing to
+    compare against, and whether it's a regression.
+
+    """
+    old = baseline.get(name)
+    if not old or usec_per_op is None:
+        return (None, False)
+    change = (usec_per_op - old) * 100.0 / old
+    return (change, change > threshold)
+
+
+def main(args=None):
+    """Parse the command line, and run the benchmarks.
+
+    Exit with a status of 1 if anything regressed.
+
+    """
+    parser = OptionParser(usage="%prog --bench [options] [NAME_PREFIX...]")
+    parser.add_option('--bench', action='store_true',
+                      help='run the benchmarks')
+    parser.add_option('--save', metavar='FILE',
+                      help='save the results as a JSON baseline')
+    parser.add_option('--compare', metavar='FILE',
+                      help='compare the results with a JSON baseline')
+    parser.add_option('--threshold', type='float', default=DEFAULT_THRESHOLD,
+                      metavar='PERCENT',
+                      help='flag anything this much slower (default: %s)' %
+                           DEFAULT_THRESHOLD)
+    parser.add_option('--min-time', type='float', default=MIN_TIME,
+                      metavar='SECONDS',
+                      help='time each loop for at least this long '
+                           '(default: %s)' % MIN_TIME)
+    parser.add_option('--repeat', type='int', default=REPEAT,
+                      help='keep the best of this many loops (default: %s)' %
+                           REPEAT)
+    (options, args) = parser.parse_args(args)
+    baseline = {}
+    if options.compare is not None:
+        f = open(options.compare)
+        try:
+            baseline = json.load(f)['results']
+        finally:
+            f.close()
+    results = OrderedDict()
+    regressions = []
+    for (name, usec_per_op) in run_benchmarks(args, options.min_time,
+                                              options.repeat):
+        results[name] = usec_per_op
+        if usec_per_op is None:
+            print '%-28s %12s' % (name, 'skipped')
+            continue
+        line = '%-28s %12.3f usec' % (name, usec_per_op)
+        (change, regressed) = compare(baseline, name, usec_per_op,
+                                      options.threshold)
+        if change is not None:
+            line += ' %+8.1f%%' % change
+        if regressed:
+            line += '  REGRESSION'
+            regressions.append(name)
+        print line
+        sys.stdout.flush()
+    if options.save is not None:
+        f = open(options.save, 'w')
+        try:
+            json.dump({'python': sys.version.split()[0], 'size': SIZE,
+                       'results': results}, f, indent=2)
+            f.write('\n')
+        finally:
+            f.close()
+    if regressions:
+        print >> sys.stderr, '%s regression(s): %s' % (
+            len(regressions), ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
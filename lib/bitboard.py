@@ -0,0 +1,321 @@
+"""This is a compact engine for the game.
+
+model.Game is built for the views.  It keeps a dict of Square objects
+and sends pydispatch signals on every move.  BitGame plays by exactly
+the same rules, but it keeps the whole board in four integers, so it's
+suitable for simulations and searches that play millions of moves.
+
+The masks use the same bit numbering as ``model.Rules.xyz_to_bit``.
+
+"""
+
+from cStringIO import StringIO
+from operator import xor
+import random
+
+from model import (BLANK, RED, BLUE, SPECIAL, SIZE, TICTACTOE_VALUE,
+                   SPECIAL_TICTACTOE_VALUE, RULES, get_rules)
+
+__docformat__ = 'restructuredtext'
+
+# These are for the standard board.  BitGame uses ``self.rules``.
+LINES_BY_BIT = RULES.lines_by_bit
+SPECIAL_MOVES = RULES.special_moves
+
+
+class BitGame:
+
+    """This is a signal-free version of model.Game.
+
+    It supports the same ``move``, ``scores``, ``current_player``,
+    ``done``, and ``winner`` semantics, and it can undo moves.
+
+    The following attributes are used:
+
+    size, rules
+      These are just like in model.Game.
+
+    owners
+      This is a dict mapping RED and BLUE to a mask of the squares they
+      own.
+
+    specials
+      This is a dict mapping RED and BLUE to a mask of the special
+      squares they own.
+
+    scores
+      This is a dict representing the scores, just like in model.Game.
+
+    move_count
+      This starts at 0 and ends at ``rules.total_squares``.
+
+    first_player
+      Who got to make the first move?
+
+    history
+      This is a list of tuples of the form ``(bit, points_earned,
+      keys)``, where keys are the keys from before the move.  It's what
+      makes undo cheap.
+
+    keys
+      These are the position's Zobrist hashes, one per symmetry, just
+      like in model.Game.  They're updated incrementally on every move
+      and undo.  Scores aren't included since they don't affect what
+      happens next.
+
+    """
+
+    def __init__(self, first_player=None, size=SIZE):
+        """Initialize to defaults.
+
+        first_player
+          If None, I'll pick randomly.
+
+        size
+          This is the width of the board, just like in model.Game.
+
+        """
+        self.size = size
+        self.rules = get_rules(size)
+        self.reset(first_player)
+
+    def reset(self, first_player=None):
+        """Reset to defaults.
+
+        first_player
+          If None, I'll pick randomly.
+
+        """
+        if first_player is None:
+            first_player = random.choice([RED, BLUE])
+        self.first_player = first_player
+        self._players = (first_player, self.other_player(first_player))
+        self.owners = {RED: 0, BLUE: 0}
+        self.specials = {RED: 0, BLUE: 0}
+        self.scores = {RED: 0, BLUE: 0}
+        self.move_count = 0
+        self.history = []
+        self.keys = ([self.rules.first_player_keys[first_player]] *
+                     len(self.rules.symmetries))
+
+    @classmethod
+    def from_game(cls, game):
+        """Return a new BitGame in the same state as the given model.Game.
+
+        The history starts out empty, so you can't undo past this point.
+
+        """
+        bit_game = cls(game.first_player, game.size)
+        for xyz in game.iter_xyz():
+            square = game.board[xyz]
+            if square.value == BLANK:
+                continue
+            bit = 1 << game.rules.xyz_to_bit(xyz)
+            bit_game.owners[square.value] |= bit
+            if square.special:
+                bit_game.specials[square.value] |= bit
+        bit_game.scores.update(game.scores)
+        bit_game.move_count = game.move_count
+        bit_game.keys = bit_game.calc_keys()
+        return bit_game
+
+    def calc_keys(self):
+        """Calculate the Zobrist hashes of the position from scratch."""
+        rules = self.rules
+        keys = ([rules.first_player_keys[self.first_player]] *
+                len(rules.symmetries))
+        for bit in range(rules.total_squares):
+            square = 1 << bit
+            for player in (RED, BLUE):
+                if self.owners[player] & square:
+                    special = bool(self.specials[player] & square)
+                    keys = map(xor, keys,
+                               rules.square_keys[player][special][bit])
+        return keys
+
+    def __repr__(self):
+        """Output the game state the same way model.Game does."""
+        buf = StringIO()
+        for z in self.rules.range_size_reversed:  # The only way is up!
+            buf.write('Level: %s\n' % (z + 1))
+            buf.write('--------\n')
+            for y in self.rules.range_size:
+                for x in self.rules.range_size:
+                    xyz = (x, y, z)
+                    buf.write('%s%s ' % (self.value_at(xyz),
+                                         self.special_at(xyz) and SPECIAL or
+                                         ' '))
+                buf.write('\n')
+            buf.write('\n')
+        if not self.done:
+            buf.write('[Level: %s] ' % (self.current_level + 1))
+            buf.write("[%s's turn] " % self.current_player)
+            buf.write("[Special: %s] " %
+                      (self.current_move_special and SPECIAL or '_'))
+        buf.write('[Score %s:%02d %s:%02d] ' %
+                  (RED, self.scores[RED],
+                   BLUE, self.scores[BLUE]))
+        buf.write('\n')
+        return buf.getvalue()
+
+    def value_at(self, xyz):
+        """Return BLANK, RED, or BLUE for the given square."""
+        bit = 1 << self.rules.xyz_to_bit(xyz)
+        for player in (RED, BLUE):
+            if self.owners[player] & bit:
+                return player
+        return BLANK
+
+    def special_at(self, xyz):
+        """Is the given square special?"""
+        bit = 1 << self.rules.xyz_to_bit(xyz)
+        return bool((self.specials[RED] | self.specials[BLUE]) & bit)
+
+    def done():
+        doc = """Is the game done?"""
+
+        def fget(self):
+            return self.move_count == self.rules.total_squares
+
+        return locals()
+    done = property(**done())
+
+    def current_level():
+        doc = """What level are we on?"""
+
+        def fget(self):
+            return self.move_count // self.rules.squares_per_level
+
+        return locals()
+    current_level = property(**current_level())
+
+    def current_player():
+        doc = """Whose turn is it?"""
+
+        def fget(self):
+            return self._players[self.move_count & 1]
+
+        return locals()
+    current_player = property(**current_player())
+
+    def current_move_special():
+        doc = """Is the current move special?"""
+
+        def fget(self):
+            return self.rules.special_moves[self.move_count]
+
+        return locals()
+    current_move_special = property(**current_move_special())
+
+    def winner():
+        doc = """Get the current winner, or None if tied."""
+
+        def fget(self):
+            difference = self.scores[RED] - self.scores[BLUE]
+            if difference == 0:
+                return None
+            elif difference > 0:
+                return RED
+            else:
+                return BLUE
+
+        return locals()
+    winner = property(**winner())
+
+    def canonical_key():
+        doc = """Get a hash that's the same for all symmetric positions."""
+
+        def fget(self):
+            return min(self.keys)
+
+        return locals()
+    canonical_key = property(**canonical_key())
+
+    def other_player(self, player):
+        """Given a player, return the other player."""
+        if player == RED:
+            return BLUE
+        return RED
+
+    def legal_bits(self):
+        """Return a list of the bits the current player may pick."""
+        taken = self.owners[RED] | self.owners[BLUE]
+        squares_per_level = self.rules.squares_per_level
+        start = self.current_level * squares_per_level
+        return [bit for bit in range(start, start + squares_per_level)
+                if not taken & (1 << bit)]
+
+    def move(self, xyz):
+        """Let the current player pick a square on the current level.
+
+        Raise a ValueError in the same cases model.Game.move does.
+        Return the number of points earned.
+
+        """
+        if xyz[2] != self.current_level:
+            raise ValueError("Wrong level")
+        bit = self.rules.xyz_to_bit(xyz)
+        if (self.owners[RED] | self.owners[BLUE]) & (1 << bit):
+            raise ValueError('Square taken')
+        return self.move_bit(bit)
+
+    def move_bit(self, bit):
+        """This is the fast version of move.
+
+        I don't validate the bit, so only pass me one from legal_bits.
+        Return the number of points earned.
+
+        """
+        move_count = self.move_count
+        player = self._players[move_count & 1]
+        square = 1 << bit
+        owned = self.owners[player] | square
+        self.owners[player] = owned
+        specials = self.specials[player]
+        rules = self.rules
+        special = rules.special_moves[move_count]
+        if special:
+            specials |= square
+            self.specials[player] = specials
+        keys = self.keys
+        self.keys = map(xor, keys, rules.square_keys[player][special][bit])
+        points_earned = 0
+        for line in rules.lines_by_bit[bit]:
+            if specials & line == line:  # Worth more, so check first.
+                points_earned += SPECIAL_TICTACTOE_VALUE
+            elif owned & line == line:
+                points_earned += TICTACTOE_VALUE
+        if points_earned:
+            self.scores[player] += points_earned
+        self.history.append((bit, points_earned, keys))
+        self.move_count = move_count + 1
+        return points_earned
+
+    def undo(self):
+        """Take back the last move.
+
+        Raise an IndexError if there's nothing to undo.
+
+        """
+        (bit, points_earned, self.keys) = self.history.pop()
+        self.move_count -= 1
+        player = self._players[self.move_count & 1]
+        square = 1 << bit
+        self.owners[player] &= ~square
+        self.specials[player] &= ~square
+        if points_earned:
+            self.scores[player] -= points_earned
+
+
+def get_moves(game):
+    """Return a tuple of the bits played so far in a model.Game or BitGame.
+
+    Return None if the game's history doesn't go back to the start,
+    e.g. if it came from ``BitGame.from_game``.
+
+    """
+    if len(game.history) != game.move_count:
+        return None
+    if isinstance(game, BitGame):
+        return tuple([entry[0] for entry in game.history])
+    return tuple([game.rules.xyz_to_bit(entry[0]) for entry in game.history])
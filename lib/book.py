@@ -0,0 +1,265 @@
+"""This is an opening book.
+
+A book is built ahead of time by enumerating every position up to a
+given number of moves and evaluating each with solver.Solver.  Only one
+position from each set of symmetric positions is kept, and positions
+where BLUE went first are stored as if RED went first, with the colors
+swapped, since that doesn't change who should play where.  Build one
+via::
+
+  python lib/book.py --depth 6 --search-depth 4 --output book.dat
+
+The file is a header followed by fixed-size records sorted by key, so
+Book can mmap it and binary search it without reading it in.
+
+The header is HEADER_FORMAT: MAGIC, VERSION, the board size, the depth,
+the search depth (EXACT_DEPTH if the values are exact), and the number
+of records.  Each record is RECORD_FORMAT: the canonical key, the value
+of the points still to be earned from the point of view of the player
+whose turn it is, and the best move as seen through the symmetry that
+produced the canonical key (NO_MOVE if there isn't one).
+
+"""
+
+import mmap
+from operator import xor
+from optparse import OptionParser
+import struct
+import sys
+
+from bitboard import BitGame
+from model import RED, BLUE, SIZE, MIN_SIZE, MAX_SIZE, get_rules
+from solver import Solver
+
+__docformat__ = 'restructuredtext'
+
+MAGIC = 'T3BK'
+VERSION = 1
+HEADER_FORMAT = '<4sBBBBI'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+RECORD_FORMAT = '<QhB'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+KEY_FORMAT = '<Q'
+EXACT_DEPTH = 255
+NO_MOVE = 255
+DEFAULT_DEPTH = 6
+DEFAULT_SEARCH_DEPTH = 4
+
+
+def calc_book_keys(game):
+    """Return the keys of a model.Game or BitGame as if RED went first.
+
+    If BLUE went first, the colors are swapped.  Either way, there's one
+    key per symmetry, just like ``game.keys``.
+
+    """
+    if game.first_player == RED:
+        return list(game.keys)
+    rules = game.rules
+    keys = [rules.first_player_keys[RED]] * len(rules.symmetries)
+    for (player, other) in ((RED, BLUE), (BLUE, RED)):
+        owned = game.owners[player]
+        specials = game.specials[player]
+        for bit in range(rules.total_squares):
+            if owned & (1 << bit):
+                special = bool(specials & (1 << bit))
+                keys = map(xor, keys, rules.square_keys[other][special][bit])
+    return keys
+
+
+def calc_earned(game):
+    """Return the points earned so far, current player minus the other."""
+    player = game.current_player
+    return game.scores[player] - game.scores[game.other_player(player)]
+
+
+def build_book(depth=DEFAULT_DEPTH, search_depth=DEFAULT_SEARCH_DEPTH,
+               size=SIZE, solver=None):
+    """Enumerate and evaluate every position up to depth moves in.
+
+    search_depth
+      This is passed to ``Solver.solve``.  If None, the values are
+      exact, which is only practical near the end of the game.
+
+    Return a sorted list of ``(key, value, bit)`` records.
+
+    """
+    if solver is None:
+        solver = Solver()
+    rules = get_rules(size)
+    game = BitGame(RED, size)
+    records = {}
+
+    def visit():
+        keys = game.keys
+        key = min(keys)
+        if key in records:
+            return
+        (value, xyz) = solver.solve(game, search_depth)
+        bit = NO_MOVE
+        if xyz is not None:
+            bit = rules.symmetries[keys.index(key)][rules.xyz_to_bit(xyz)]
+        records[key] = (key, value - calc_earned(game), bit)
+        if game.move_count >= depth:
+            return
+        for bit in game.legal_bits():
+            game.move_bit(bit)
+            visit()
+            game.undo()
+
+    visit()
+    records = records.values()
+    records.sort()
+    return records
+
+
+def write_book(filename, records, depth, search_depth, size=SIZE):
+    """Write the records from build_book to a file."""
+    if search_depth is None:
+        search_depth = EXACT_DEPTH
+    f = open(filename, 'wb')
+    try:
+        f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, size, depth,
+                            search_depth, len(records)))
+        for record in records:
+            f.write(struct.pack(RECORD_FORMAT, *record))
+    finally:
+        f.close()
+
+
+class Book:
+
+    """This is an opening book file, opened for lookups.
+
+    The following attributes are used:
+
+    size, depth
+      These are the board size and the number of moves the book covers.
+
+    search_depth
+      This is how far ahead each position was searched, or None if the
+      values are exact.
+
+    count
+      This is the number of records.
+
+    """
+
+    def __init__(self, filename):
+        """Map the file into memory.
+
+        Raise a ValueError if it isn't a book, or if it's truncated.  The
+        file is closed first.
+
+        """
+        self.file = open(filename, 'rb')
+        self.map = None
+        try:
+            self._read_header(filename)
+        except:
+            self.close()
+            raise
+
+    def _read_header(self, filename):
+        """Map the file, and check and read its header."""
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER_SIZE:
+            raise ValueError('Not a book: %s' % filename)
+        (magic, version, self.size, self.depth, search_depth,
+         self.count) = struct.unpack_from(HEADER_FORMAT, self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a book: %s' % filename)
+        if len(self.map) != HEADER_SIZE + self.count * RECORD_SIZE:
+            raise ValueError('Truncated book: %s' % filename)
+        if not MIN_SIZE <= self.size <= MAX_SIZE:
+            raise ValueError('Bad board size: %s' % self.size)
+        if search_depth == EXACT_DEPTH:
+            search_depth = None
+        self.search_depth = search_depth
+        self.rules = get_rules(self.size)
+
+    def __len__(self):
+        """Return the number of records."""
+        return self.count
+
+    def close(self):
+        """Unmap and close the file."""
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def get(self, key):
+        """Return ``(value, bit)`` for the given canonical key, or None.
+
+        bit is in the frame of the symmetry that produced the key, or
+        NO_MOVE.
+
+        """
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER_SIZE + middle * RECORD_SIZE
+            (key_,) = struct.unpack_from(KEY_FORMAT, self.map, offset)
+            if key_ < key:
+                low = middle + 1
+            elif key_ > key:
+                high = middle
+            else:
+                (key_, value, bit) = struct.unpack_from(RECORD_FORMAT,
+                                                        self.map, offset)
+                return (value, bit)
+        return None
+
+    def lookup(self, game):
+        """Return ``(value, xyz)`` for a model.Game or BitGame, or None.
+
+        These are just like what ``Solver.solve`` returns: value
+        includes the points that have already been earned.  Return None
+        if the position isn't in the book.
+
+        """
+        if game.size != self.size:
+            return None
+        keys = calc_book_keys(game)
+        key = min(keys)
+        entry = self.get(key)
+        if entry is None:
+            return None
+        (value, bit) = entry
+        xyz = None
+        if bit != NO_MOVE:
+            symmetry = self.rules.inverse_symmetries[keys.index(key)]
+            xyz = self.rules.bit_to_xyz(symmetry[bit])
+        return (calc_earned(game) + value, xyz)
+
+
+def main(args=None):
+    """Parse the command line and build a book."""
+    parser = OptionParser(usage="%prog --output FILE [options]")
+    parser.add_option('--depth', type='int', default=DEFAULT_DEPTH,
+                      help='number of moves to cover (default: %s)' %
+                           DEFAULT_DEPTH)
+    parser.add_option('--search-depth', type='int',
+                      default=DEFAULT_SEARCH_DEPTH,
+                      help='moves to look ahead from each position '
+                           '(default: %s)' % DEFAULT_SEARCH_DEPTH)
+    parser.add_option('--exact', action='store_true',
+                      help='search to the end of the game instead')
+    parser.add_option('--size', type='int', default=SIZE,
+                      help='width of the board (default: %s)' % SIZE)
+    parser.add_option('--output', metavar='FILE', help='book file to write')
+    (options, args) = parser.parse_args(args)
+    if options.output is None:
+        parser.error('--output is required')
+    search_depth = options.search_depth
+    if options.exact:
+        search_depth = None
+    records = build_book(options.depth, search_depth, options.size)
+    write_book(options.output, records, options.depth, search_depth,
+               options.size)
+    print >> sys.stderr, '%s positions' % len(records)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""This is the client side of networked play.
+
+See server.py for the protocol.  RemoteGame keeps a local model.Game in
+sync with a game on the server.  The server decides what happens, and
+RemoteGame replays it on the local game, so the local game sends the
+usual pydispatch signals and the views don't know the difference.
+
+"""
+
+import socket
+import threading
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from model import SIZE
+
+__docformat__ = 'restructuredtext'
+
+
+class RemoteGame:
+
+    """This is a connection to a game on a server.
+
+    Messages are read in a background thread and passed to a callback.
+    Since the local game belongs to whoever is running the event loop,
+    it's up to them to pass each message back to handle_message.
+
+    The following attributes are used:
+
+    game
+      This is the local model.Game.
+
+    game_id
+      This is the id of the game on the server, once we've joined.
+
+    seat
+      This is RED or BLUE, or None if we're just watching.
+
+    """
+
+    def __init__(self, host, port, game, callback, game_id=None, size=SIZE):
+        """Connect, and start or join a game.
+
+        callback
+          I call this from a background thread with each message from
+          the server, as a dict.  When the connection closes, I call it
+          with None.
+
+        game_id
+          If None, start a new game.  Otherwise, join this one.
+
+        """
+        self.game = game
+        self.game_id = None
+        self.seat = None
+        self.callback = callback
+        self.socket = socket.create_connection((host, port))
+        self.lock = threading.Lock()
+        if game_id is None:
+            self.send_message({'cmd': 'new', 'size': size})
+        else:
+            self.send_message({'cmd': 'join', 'game': game_id})
+        thread = threading.Thread(target=self._read)
+        thread.setDaemon(True)
+        thread.start()
+
+    def send_message(self, message):
+        """Send a message as a line of JSON."""
+        self.lock.acquire()
+        try:
+            self.socket.sendall(json.dumps(message) + '\n')
+        finally:
+            self.lock.release()
+
+    def move(self, xyz):
+        """Ask the server to make a move."""
+        self.send_message({'cmd': 'move', 'xyz': list(xyz)})
+
+    def reset(self):
+        """Ask the server to start the game over."""
+        self.send_message({'cmd': 'reset'})
+
+    def close(self):
+        """Hang up.
+
+        The background thread sees the end of the connection, and calls
+        the callback with None.
+
+        """
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.socket.close()
+
+    def handle_message(self, message):
+        """Apply a message from the server to the local game.
+
+        Call this from whatever thread owns the game.  Return the
+        message, so that you can look for errors.
+
+        If the game on the server isn't the same size as the local game,
+        leave it, hang up, and raise a ValueError.
+
+        """
+        event = message['event']
+        if event in ('joined', 'state'):
+            if message['size'] != self.game.size:
+                self.send_message({'cmd': 'leave'})
+                self.close()
+                raise ValueError('Game %s is %s wide, but this board is %s' %
+                                 (message['game'], message['size'],
+                                  self.game.size))
+            self.game_id = message['game']
+            if event == 'joined':
+                self.seat = message['seat']
+            # Replay it all as one batch, so the views only update once.
+            self.game.begin()
+            try:
+                self.game.reset(message['first_player'])
+                for xyz in message['moves']:
+                    self.game.move(tuple(xyz))
+            finally:
+                self.game.commit()
+        elif event == 'move':
+            self.game.move(tuple(message['xyz']))
+        elif event == 'reset':
+            self.game.reset(message['first_player'])
+        return message
+
+    def _read(self):
+        """Read messages and pass them to the callback until EOF."""
+        f = self.socket.makefile('rb')
+        try:
+            for line in f:
+                self.callback(json.loads(line))
+        except socket.error:
+            pass
+        self.callback(None)
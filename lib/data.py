@@ -2,11 +2,39 @@
 
 Loads data files from the "data" directory shipped with a game.
 
-Enhancing this to handle caching, etc. is left as an exercise for the reader.
+The small images are packed into a single texture atlas, and load_image
+hands out subsurfaces of it.  The atlas is saved in ATLAS_FILENAME so
+that startup only has to decode one file.  Rebuild it whenever the
+images change via::
+
+  python lib/data.py --build-atlas
+
+The file is a header, ATLAS_HEADER_FORMAT, holding ATLAS_MAGIC,
+ATLAS_VERSION, the atlas's width and height, and the number of images.
+Then there's an entry for every image, ATLAS_ENTRY_FORMAT, holding the
+image file's size in bytes and CRC-32, its rect within the atlas, and
+the length of its filename, followed by the filename.  Images that
+aren't in the atlas have an empty rect.  Last come the pixels, as raw
+RGBA.
+
+If it's missing, corrupt, or out of date, I'll pack the images at
+startup instead.  To keep startup down to one read, I only compare the
+sizes of the image files then.  An edit that keeps an image the same
+size takes the CRC-32s to notice, which is what this is for::
+
+  python lib/data.py --check-atlas
+
+Images that are too big for the atlas are loaded when they're first
+needed, and they're kept in a cache with a memory budget.
 
 """
 
+from collections import OrderedDict
+from optparse import OptionParser
 import os
+import struct
+import sys
+import zlib
 
 import pygame
 
@@ -14,6 +42,18 @@ __docformat__ = 'restructuredtext'
 
 dirname = os.path.dirname(__file__)
 
+ATLAS_FILENAME = 'atlas.dat'
+ATLAS_MAGIC = 'T3AT'
+ATLAS_VERSION = 3
+ATLAS_HEADER_FORMAT = '<4sBHHH'
+ATLAS_HEADER_SIZE = struct.calcsize(ATLAS_HEADER_FORMAT)
+ATLAS_ENTRY_FORMAT = '<IIHHHHH'
+ATLAS_ENTRY_SIZE = struct.calcsize(ATLAS_ENTRY_FORMAT)
+ATLAS_WIDTH = 256
+ATLAS_MAX_IMAGE_SIZE = (256, 256)
+IMAGE_EXTENSIONS = ('.png',)
+IMAGE_CACHE_BUDGET = 16 * 1024 * 1024
+
 
 def find(filename):
     """Given a filename, return a useable path for it."""
@@ -25,19 +65,272 @@ def load(filename):
     return open(find(filename), 'rb')
 
 
+def list_images():
+    """Return a sorted list of the images in the data directory."""
+    return sorted(filename for filename in os.listdir(find(''))
+                  if os.path.splitext(filename)[1] in IMAGE_EXTENSIONS)
+
+
+def get_sizes():
+    """Return a dict mapping each image to its size in bytes.
+
+    This only needs a stat per image, so it's what startup checks.
+
+    """
+    return dict((filename, os.path.getsize(find(filename)))
+                for filename in list_images())
+
+
+def get_stamps():
+    """Return a dict mapping each image to ``(size, crc32)``.
+
+    It's stored in the atlas so that I can tell when it's out of date
+    without decoding the images.  Modification times would change with
+    every checkout.  This reads every image, so it's only for building
+    and checking the atlas.
+
+    """
+    stamps = {}
+    for (filename, size) in get_sizes().items():
+        f = load(filename)
+        try:
+            stamps[filename] = (size, zlib.crc32(f.read()) & 0xffffffff)
+        finally:
+            f.close()
+    return stamps
+
+
+def pack(sizes, width=ATLAS_WIDTH):
+    """Pack rectangles onto shelves, and return ``(height, index)``.
+
+    sizes
+      This is a dict mapping names to ``(width, height)``.  None of
+      them may be wider than width.
+
+    index maps each name to its rect, ``(x, y, width, height)``.  The
+    tallest rectangles go first, so each shelf wastes as little space
+    as possible.
+
+    """
+    index = {}
+    x = y = shelf_height = 0
+    for name in sorted(sizes, key=lambda name: (-sizes[name][1], name)):
+        (w, h) = sizes[name]
+        if x + w > width:
+            y += shelf_height
+            x = shelf_height = 0
+        index[name] = (x, y, w, h)
+        x += w
+        shelf_height = max(shelf_height, h)
+    return (y + shelf_height, index)
+
+
+def build_atlas():
+    """Pack the small images into an atlas.
+
+    Return ``(size, index, pixels, stamps)``.  index maps each image to
+    its rect within the atlas.  pixels is an RGBA string.  stamps comes
+    from get_stamps.
+
+    """
+    images = {}
+    for filename in list_images():
+        image = pygame.image.load(find(filename))
+        (w, h) = image.get_size()
+        if w <= ATLAS_MAX_IMAGE_SIZE[0] and h <= ATLAS_MAX_IMAGE_SIZE[1]:
+            images[filename] = image
+    sizes = dict((filename, image.get_size())
+                 for (filename, image) in images.items())
+    width = max([ATLAS_WIDTH] + [w for (w, h) in sizes.values()])
+    (height, index) = pack(sizes, width)
+    pixels = bytearray(width * height * 4)
+    for (filename, image) in images.items():
+        (x, y, w, h) = index[filename]
+        data = pygame.image.tostring(image, 'RGBA')
+        row = w * 4
+        for i in range(h):
+            start = ((y + i) * width + x) * 4
+            pixels[start:start + row] = data[i * row:(i + 1) * row]
+    return ((width, height), index, str(pixels), get_stamps())
+
+
+def encode_atlas((size, index, pixels, stamps)):
+    """Return the file format for what build_atlas returns."""
+    (width, height) = size
+    parts = [struct.pack(ATLAS_HEADER_FORMAT, ATLAS_MAGIC, ATLAS_VERSION,
+                         width, height, len(stamps))]
+    for filename in sorted(stamps):
+        (x, y, w, h) = index.get(filename, (0, 0, 0, 0))
+        (size, crc) = stamps[filename]
+        parts.append(struct.pack(ATLAS_ENTRY_FORMAT, size, crc,
+                                 x, y, w, h, len(filename)))
+        parts.append(filename)
+    parts.append(pixels)
+    return ''.join(parts)
+
+
+def decode_atlas(data):
+    """Parse the file format, and return what build_atlas returns.
+
+    Raise a ValueError if it's corrupt or from another version.
+
+    """
+    if len(data) < ATLAS_HEADER_SIZE:
+        raise ValueError('Truncated atlas header')
+    (magic, version, width, height, count) = struct.unpack(
+        ATLAS_HEADER_FORMAT, data[:ATLAS_HEADER_SIZE])
+    if magic != ATLAS_MAGIC or version != ATLAS_VERSION:
+        raise ValueError('Not an atlas')
+    offset = ATLAS_HEADER_SIZE
+    index = {}
+    stamps = {}
+    for i in xrange(count):
+        entry = data[offset:offset + ATLAS_ENTRY_SIZE]
+        if len(entry) < ATLAS_ENTRY_SIZE:
+            raise ValueError('Truncated atlas entry')
+        (size, crc, x, y, w, h, length) = struct.unpack(ATLAS_ENTRY_FORMAT,
+                                                        entry)
+        offset += ATLAS_ENTRY_SIZE
+        filename = data[offset:offset + length]
+        offset += length
+        stamps[filename] = (size, crc)
+        if w and h:
+            if x + w > width or y + h > height:
+                raise ValueError('Bad rect for %s' % filename)
+            index[filename] = (x, y, w, h)
+    pixels = data[offset:]
+    if len(pixels) != width * height * 4:
+        raise ValueError('Wrong number of pixels')
+    return ((width, height), index, pixels, stamps)
+
+
+def write_atlas():
+    """Build the atlas and save it in ATLAS_FILENAME."""
+    data = encode_atlas(build_atlas())
+    f = open(find(ATLAS_FILENAME), 'wb')
+    try:
+        f.write(data)
+    finally:
+        f.close()
+
+
+def read_atlas(check=False):
+    """Read the atlas from ATLAS_FILENAME.
+
+    Return the same thing as build_atlas, or None if the file is
+    missing, corrupt, or out of date.
+
+    check
+      If True, compare the CRC-32s of the images too, not just their
+      sizes.  That means reading every image.
+
+    """
+    try:
+        f = load(ATLAS_FILENAME)
+    except IOError:
+        return None
+    try:
+        data = f.read()
+    finally:
+        f.close()
+    try:
+        atlas = decode_atlas(data)
+    except ValueError:
+        return None
+    stamps = atlas[3]
+    if check:
+        if stamps != get_stamps():
+            return None
+    elif dict((filename, size) for (filename, (size, crc))
+              in stamps.items()) != get_sizes():
+        return None
+    return atlas
+
+
+def preload():
+    """Load the atlas, and make a subsurface for every image in it.
+
+    Call this at startup, after setting the display mode, so that no
+    image has to be decoded in the middle of the game.  It's a NULL
+    operation if it's already been done.
+
+    """
+    if load_image.atlas is not None:
+        return
+    atlas = read_atlas()
+    if atlas is None:
+        atlas = build_atlas()
+    (size, index, pixels, stamps) = atlas
+    surface = pygame.image.fromstring(pixels, size, 'RGBA')
+    if pygame.display.get_surface() is not None:
+        surface = surface.convert_alpha()
+    load_image.atlas = surface
+    for (filename, rect) in index.items():
+        load_image.cache[filename] = surface.subsurface(rect)
+
+
 def load_image(filename):
     """Find, load, and return an image.  Handle caching.
 
     Setup the alpha channel, if appropriate.
 
+    Images in the atlas are always cached.  The rest are kept in
+    least-recently-used order, and the oldest are thrown out when they
+    take more than IMAGE_CACHE_BUDGET bytes.
+
     """
-    if filename not in load_image.cache:
+    preload()
+    if filename in load_image.cache:
+        return load_image.cache[filename]
+    lru = load_image.lru
+    if filename in lru:
+        image = lru.pop(filename)
+    else:
         image = pygame.image.load(find(filename))
         if image.get_alpha() is None:
             image = image.convert()
         else:
             image = image.convert_alpha()
-        load_image.cache[filename] = image
-    return load_image.cache[filename]
+        load_image.lru_bytes += calc_image_bytes(image)
+        while lru and load_image.lru_bytes > IMAGE_CACHE_BUDGET:
+            (filename_, image_) = lru.popitem(last=False)
+            load_image.lru_bytes -= calc_image_bytes(image_)
+    lru[filename] = image
+    return image
 
+load_image.atlas = None
 load_image.cache = {}
+load_image.lru = OrderedDict()
+load_image.lru_bytes = 0
+
+
+def calc_image_bytes(image):
+    """Return roughly how much memory the image takes."""
+    (w, h) = image.get_size()
+    return w * h * image.get_bytesize()
+
+
+def main(args=None):
+    """Parse the command line, and build or check the atlas.
+
+    When checking, exit with a status of 1 if the atlas is out of date.
+
+    """
+    parser = OptionParser(usage="%prog --build-atlas | --check-atlas")
+    parser.add_option('--build-atlas', action='store_true',
+                      help='pack the small images into %s' % ATLAS_FILENAME)
+    parser.add_option('--check-atlas', action='store_true',
+                      help='check that %s is up to date' % ATLAS_FILENAME)
+    (options, args) = parser.parse_args(args)
+    if options.build_atlas:
+        write_atlas()
+    elif options.check_atlas:
+        if read_atlas(check=True) is None:
+            sys.exit('%s is out of date; run with --build-atlas' %
+                     ATLAS_FILENAME)
+    else:
+        parser.error('--build-atlas or --check-atlas is required')
+
+
+if __name__ == '__main__':
+    main()
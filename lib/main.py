@@ -4,6 +4,7 @@ It contains the entry point used by the run_game.py script.
 
 """
 
+from optparse import OptionParser
 import os.path
 import sys
 import webbrowser
@@ -11,8 +12,14 @@ import webbrowser
 import pygame
 from pygame.locals import *
 
+from pydispatch import dispatcher
+
+from book import Book
+from client import RemoteGame
 import data
+from mcts import MCTSPlayer
 import model
+from profiler import profiler
 from scheduler import scheduler
 import view
 
@@ -22,16 +29,81 @@ TITLE = "TicTacToe3"
 DISPLAY_MODE = (view.SCREEN_WIDTH, view.SCREEN_HEIGHT)
 FRAMES_PER_SEC = 30
 BACKGROUND = (0, 0, 0)
+WAKEUP = USEREVENT
+MOVE_CHOSEN = USEREVENT + 1
+NETWORK_MESSAGE = USEREVENT + 2
+COLORS = {'red': model.RED, 'blue': model.BLUE}
+
+
+def wait_for_event(timeout=None):
+    """Block until there's an event, and return it.
+
+    timeout
+      If not None, give up after this many milliseconds, and return an
+      event of type WAKEUP.  Older versions of PyGame don't support a
+      timeout for pygame.event.wait, so I use a PyGame timer instead.
+
+    """
+    if timeout is None:
+        return pygame.event.wait()
+    if timeout <= 0:
+        return pygame.event.Event(WAKEUP)
+    pygame.time.set_timer(WAKEUP, timeout)
+    try:
+        return pygame.event.wait()
+    finally:
+        pygame.time.set_timer(WAKEUP, 0)
+
+
+def parse_args(args=None):
+    """Parse the command line.
+
+    Return ``(options, computer_players)``.  computer_players is a dict
+    mapping RED and/or BLUE to an mcts.MCTSPlayer.
+
+    """
+    parser = OptionParser()
+    parser.add_option('-t', '--text', action='store_true',
+                      help='play in text mode')
+    parser.add_option('--computer', action='append', default=[],
+                      choices=COLORS.keys(), metavar='COLOR',
+                      help='let the computer play red or blue (or both)')
+    parser.add_option('--iterations', type='int', metavar='N',
+                      help='computer: rollouts per move')
+    parser.add_option('--seconds', type='float', metavar='S',
+                      help='computer: seconds per move')
+    parser.add_option('--workers', type='int', default=1, metavar='K',
+                      help='computer: processes for rollouts (default: 1)')
+    parser.add_option('--book', metavar='FILE',
+                      help='computer: opening book (see lib/book.py)')
+    parser.add_option('--connect', metavar='HOST:PORT',
+                      help='play on a server (see lib/server.py)')
+    parser.add_option('--game', type='int', metavar='ID',
+                      help='join this game on the server instead of '
+                           'starting one')
+    (options, args) = parser.parse_args(args)
+    book = None
+    if options.book is not None:
+        book = Book(options.book)
+    computer_players = {}
+    for color in options.computer:
+        computer_players[COLORS[color]] = MCTSPlayer(
+            options.iterations, options.seconds, options.workers,
+            book=book)
+    return (options, computer_players)
 
 
 def main():
 
     """This is the entry point to the application."""
 
+    (options, computer_players) = parse_args(sys.argv[1:])
+    profiler.install()
+
     # This is for text mode.
 
-    if len(sys.argv) == 2 and sys.argv[1] == '-t':
-        model.main()
+    if options.text:
+        model.main(computer_players)
         sys.exit(0)
 
     # Do initialization.
@@ -43,41 +115,166 @@ def main():
     background = pygame.Surface(screen.get_size()).convert()
     background.fill(BACKGROUND)
     pygame.display.flip()
+    data.preload()
+    # Nothing on the screen changes when the mouse moves, so don't
+    # bother waking up for it.
+    pygame.event.set_blocked(MOUSEMOTION)
 
     game_model = model.Game()
     board_view = view.Board(game_model)
     score_board = view.ScoreBoard(game_model)
     rendering_groups = [board_view, score_board]
 
+    # When playing on a server, the server decides what happens, and
+    # the messages it sends are replayed on game_model.  They're read
+    # in the background and posted as NETWORK_MESSAGE events.
+
+    remote = None
+    if options.connect:
+        (host, port) = options.connect.rsplit(':', 1)
+
+        def post_message(message):
+            pygame.event.post(pygame.event.Event(NETWORK_MESSAGE,
+                                                 message=message))
+
+        remote = RemoteGame(host, int(port), game_model, post_message,
+                            options.game)
+
+    def may_move(player):
+        if remote is not None:
+            return remote.seat == player and player not in computer_players
+        return player not in computer_players
+
+    def play(xyz):
+        if remote is not None:
+            remote.move(xyz)
+        else:
+            game_model.move(xyz)
+
+    # The sprites only change in response to the model's signals and
+    # the scheduler's callbacks.  If neither has happened since the
+    # last frame, there's nothing to draw.
+
+    dirty = [True]
+
+    def mark_dirty():
+        dirty[0] = True
+
+    dispatcher.connect(mark_dirty, sender=game_model)
+
+    # Computer players think in the background, and post a MOVE_CHOSEN
+    # event when they're done.  Each request gets a new turn number so
+    # that answers that are out of date, e.g. because of a reset, can
+    # be thrown away.
+
+    turn = 0
+    thinking = None
+
+    def post_move(turn):
+        def callback(xyz):
+            pygame.event.post(pygame.event.Event(MOVE_CHOSEN, xyz=xyz,
+                                                 turn=turn))
+        return callback
+
+    # See profiler.py for turning on the per-phase timings.
+
     while True:
 
-        clock.tick(FRAMES_PER_SEC)
-        scheduler.tick()
+        profiler.begin('frame')
+        profiler.begin('tick')
+        if scheduler.tick():
+            dirty[0] = True
+        profiler.end()
+
+        # Render the changes, if there are any.
+
+        if dirty[0]:
+            dirty[0] = False
+            for i in rendering_groups:
+                profiler.begin('update')
+                i.update()
+                profiler.end()
+                profiler.begin('clear')
+                i.clear(screen, background)
+                profiler.end()
+                profiler.begin('draw')
+                pygame.display.update(i.draw(screen))
+                profiler.end()
+            profiler.begin('throttle')
+            clock.tick(FRAMES_PER_SEC)
+            profiler.end()
+
+        if (thinking is None and not game_model.done and
+            game_model.current_player in computer_players and
+            (remote is None or remote.seat == game_model.current_player)):
+            turn += 1
+            thinking = turn
+            profiler.begin('think')
+            computer_players[game_model.current_player].think(
+                game_model, post_move(turn))
+            profiler.end()
+        profiler.end()
+
+        # Sleep until there's user input or a timer is due.
+
+        profiler.begin('wait')
+        deadline = scheduler.next_deadline()
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - scheduler.clock()
+        events = [wait_for_event(timeout)] + pygame.event.get()
+        profiler.end()
 
         # Handle user input.
 
-        for event in pygame.event.get():
-            if event.type == KEYDOWN:
-                if event.key in (K_ESCAPE, K_q) or event.type == QUIT:
+        profiler.begin('events')
+        for event in events:
+            if event.type == QUIT:
+                sys.exit(0)
+            elif event.type == VIDEOEXPOSE:
+                screen.blit(background, (0, 0))
+                for i in rendering_groups:
+                    i.draw(screen)
+                pygame.display.flip()
+            elif event.type == KEYDOWN:
+                if event.key in (K_ESCAPE, K_q):
                     sys.exit(0)
                 elif event.key == K_h:
                     url = "file://" + os.path.abspath(data.find("help.html"))
                     webbrowser.open(url, new=True)
                 elif event.key == K_r:
-                    game_model.reset()
-            elif event.type == MOUSEBUTTONDOWN:
+                    thinking = None
+                    if remote is not None:
+                        remote.reset()
+                    else:
+                        game_model.reset()
+            elif event.type == MOVE_CHOSEN:
+                if event.turn == thinking:
+                    play(event.xyz)
+                    # Over the network, keep waiting until the server
+                    # says what happened.
+                    if remote is None:
+                        thinking = None
+            elif event.type == NETWORK_MESSAGE:
+                if event.message is None:
+                    sys.exit("Lost the connection to the server")
+                try:
+                    remote.handle_message(event.message)
+                except ValueError, e:
+                    sys.exit(str(e))
+                if event.message['event'] == 'joined':
+                    pygame.display.set_caption('%s (game %s)' %
+                                               (TITLE, remote.game_id))
+                if event.message['event'] not in ('signal', 'games'):
+                    thinking = None
+            elif (event.type == MOUSEBUTTONDOWN and
+                  may_move(game_model.current_player)):
                 for square_view in board_view:
                     if square_view.rect.collidepoint(*pygame.mouse.get_pos()):
                         xyz = square_view.square_model.xyz
                         try:
-                            game_model.move(xyz)
+                            play(xyz)
                         except ValueError:
                             pass
                         break
-
-        # Provide the simulation and render it.
-
-        for i in rendering_groups:
-            i.update()
-            i.clear(screen, background)
-            pygame.display.update(i.draw(screen))
+        profiler.end()
@@ -0,0 +1,384 @@
+"""This is a Monte Carlo Tree Search computer player.
+
+It grows a search tree one position at a time, picking which branch to
+explore with UCT (Upper Confidence bounds applied to Trees), and it
+rates each new position by playing it out randomly to the end.  The
+rollouts run on bitboard.BitGame, so they don't touch pydispatch or
+model.Square.
+
+With more than one worker, rollouts are run in a pool of processes.
+Each round, I pick a batch of leaves, using a "virtual loss" so that
+the batch is spread out over the tree instead of piling onto the same
+leaf, and the workers play several rollouts from each.  Hence, more
+cores means more rollouts in the same amount of time.
+
+The tree is kept between moves.  When it's my turn again, I walk down
+the tree along the moves that were played, and keep that subtree.
+
+"""
+
+from math import log, sqrt
+from multiprocessing import Pool
+import random
+import threading
+import time
+
+from bitboard import BitGame, get_moves
+from model import RED, BLUE
+
+__docformat__ = 'restructuredtext'
+
+DEFAULT_ITERATIONS = 5000
+EXPLORATION = sqrt(2)
+LEAVES_PER_WORKER = 4
+ROLLOUTS_PER_LEAF = 8
+REWARDS = {RED: 1.0, None: 0.5, BLUE: 0.0}
+
+
+def take_snapshot(game):
+    """Return a picklable copy of the state of a model.Game or BitGame.
+
+    It's a tuple of the form ``(size, first_player, owners, specials,
+    scores, move_count)``.
+
+    """
+    return (game.size, game.first_player, dict(game.owners),
+            dict(game.specials), dict(game.scores), game.move_count)
+
+
+def restore_snapshot(snapshot):
+    """Return a new BitGame from a snapshot."""
+    (size, first_player, owners, specials, scores, move_count) = snapshot
+    game = BitGame(first_player, size)
+    game.owners.update(owners)
+    game.specials.update(specials)
+    game.scores.update(scores)
+    game.move_count = move_count
+    game.keys = game.calc_keys()
+    return game
+
+
+def get_untried(game):
+    """Return a list of the legal bits, or [] if the game is done."""
+    if game.done:
+        return []
+    return game.legal_bits()
+
+
+def rollout(game, rand):
+    """Play randomly to the end, and return RED's reward.
+
+    The reward is 1 for a win, 0.5 for a tie, and 0 for a loss.  The game
+    is left as it was.
+
+    """
+    moves = 0
+    while not game.done:
+        game.move_bit(rand.choice(game.legal_bits()))
+        moves += 1
+    reward = REWARDS[game.winner]
+    for i in xrange(moves):
+        game.undo()
+    return reward
+
+
+def run_rollouts((snapshot, bits, count, seed)):
+    """Play count rollouts after the given moves, and sum RED's rewards.
+
+    This is what the worker processes run.
+
+    """
+    game = restore_snapshot(snapshot)
+    for bit in bits:
+        game.move_bit(bit)
+    rand = random.Random(seed)
+    reward = 0.0
+    for i in xrange(count):
+        reward += rollout(game, rand)
+    return reward
+
+
+class Node:
+
+    """This is a position in the search tree.
+
+    The following attributes are used:
+
+    bit
+      This is the move that led here.  It's None for the root.
+
+    player
+      This is the player who made that move.  It's None for the root.
+
+    parent
+      This is the parent Node, or None for the root.
+
+    children
+      This is a list of the Nodes that have been expanded.
+
+    untried
+      This is a list of the legal bits that haven't been expanded yet.
+
+    visits
+      This is the number of rollouts through this node.
+
+    reward
+      This is the sum of the rewards of those rollouts, from the point
+      of view of player.
+
+    """
+
+    def __init__(self, bit, player, parent, untried):
+        """Start with no visits."""
+        self.bit = bit
+        self.player = player
+        self.parent = parent
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        self.reward = 0.0
+
+    def select_child(self, exploration):
+        """Return the child with the best upper confidence bound."""
+        log_visits = log(self.visits)
+        best_score = None
+        best_child = None
+        for child in self.children:
+            score = (child.reward / child.visits +
+                     exploration * sqrt(log_visits / child.visits))
+            if score > best_score:
+                best_score = score
+                best_child = child
+        return best_child
+
+    def find_child(self, bit):
+        """Return the child for the given bit, or None."""
+        for child in self.children:
+            if child.bit == bit:
+                return child
+        return None
+
+
+class MCTSPlayer:
+
+    """This is a computer player.
+
+    The following attributes are used:
+
+    iterations, seconds
+      These are the budget for each move.  I stop searching as soon as
+      either one runs out.
+
+    workers
+      This is the number of processes to run rollouts in.  If it's 1,
+      I don't bother with a pool.
+
+    book
+      This is a book.Book, or None.  If the position is in it, I play
+      the book move without searching.
+
+    root
+      This is the root of the search tree, or None.
+
+    rollouts
+      This is how many rollouts went into the last move.
+
+    """
+
+    def __init__(self, iterations=None, seconds=None, workers=1,
+                 exploration=EXPLORATION, seed=None, book=None):
+        """Setup the budget.
+
+        iterations
+          This is the number of rollouts per move.  If both it and
+          seconds are None, it defaults to DEFAULT_ITERATIONS.
+
+        seconds
+          This is the number of seconds to think per move.
+
+        workers
+          This is the number of processes to use for rollouts.
+
+        exploration
+          This is the UCT exploration constant.  Higher values make the
+          search wider.
+
+        seed
+          This seeds my random number generator.
+
+        book
+          This is an opening book.  See book.Book.
+
+        """
+        if iterations is None and seconds is None:
+            iterations = DEFAULT_ITERATIONS
+        self.iterations = iterations
+        self.seconds = seconds
+        self.workers = workers
+        self.exploration = exploration
+        self.rand = random.Random(seed)
+        self.book = book
+        self.pool = None
+        self.root = None
+        self.rollouts = 0
+        self._root_id = None
+        self._lock = threading.Lock()
+
+    def choose_move(self, game):
+        """Return the move, ``(x, y, z)``, I'd make in the given game.
+
+        game is either a model.Game or a bitboard.BitGame.  It's left as
+        it was.
+
+        """
+        return self._choose(take_snapshot(game), get_moves(game))
+
+    def think(self, game, callback):
+        """Choose a move in a background thread.
+
+        I take a snapshot of game right away, so it's okay to keep
+        using it.  When I'm done, I call ``callback(xyz)`` from the
+        background thread.  Return the thread.
+
+        """
+        args = (take_snapshot(game), get_moves(game))
+
+        def run():
+            callback(self._choose(*args))
+
+        thread = threading.Thread(target=run)
+        thread.setDaemon(True)
+        thread.start()
+        return thread
+
+    def close(self):
+        """Shut down the pool, if there is one."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def _choose(self, snapshot, moves):
+        """This is the guts of choose_move."""
+        self._lock.acquire()
+        try:
+            game = restore_snapshot(snapshot)
+            if game.done:
+                return None
+            if self.book is not None:
+                entry = self.book.lookup(game)
+                if entry is not None and entry[1] is not None:
+                    self.rollouts = 0
+                    return entry[1]
+            self._advance(game, snapshot, moves)
+            if self.seconds is not None:
+                deadline = time.time() + self.seconds
+            self.rollouts = 0
+            while True:
+                if (self.iterations is not None and
+                    self.rollouts >= self.iterations):
+                    break
+                if self.seconds is not None and time.time() >= deadline:
+                    break
+                if self.workers == 1:
+                    self._iterate(game)
+                else:
+                    self._iterate_batch(game, snapshot)
+            best = None
+            for child in self.root.children:
+                if best is None or child.visits > best.visits:
+                    best = child
+            if best is None:
+                return None
+            return game.rules.bit_to_xyz(best.bit)
+        finally:
+            self._lock.release()
+
+    def _advance(self, game, snapshot, moves):
+        """Set root for the given position, reusing the old tree if I can."""
+        (size, first_player) = snapshot[:2]
+        root = None
+        if (self.root is not None and moves is not None and
+            self._root_id[:2] == (size, first_player) and
+            self._root_id[2] is not None):
+            root_moves = self._root_id[2]
+            if moves[:len(root_moves)] == root_moves:
+                root = self.root
+                for bit in moves[len(root_moves):]:
+                    root = root.find_child(bit)
+                    if root is None:
+                        break
+        if root is None:
+            root = Node(None, None, None, get_untried(game))
+        root.parent = None
+        self.root = root
+        self._root_id = (size, first_player, moves)
+
+    def _select(self, game, virtual_loss):
+        """Walk down the tree, expand a leaf, and return it.
+
+        Return ``(node, bits)``, where bits are the moves that lead to
+        node.  They're left applied to game.  If virtual_loss, count a
+        visit without a reward on every node along the way.
+
+        """
+        node = self.root
+        bits = []
+        if virtual_loss:
+            node.visits += 1
+        while not node.untried and node.children:
+            node = node.select_child(self.exploration)
+            game.move_bit(node.bit)
+            bits.append(node.bit)
+            if virtual_loss:
+                node.visits += 1
+        if node.untried:
+            bit = node.untried.pop(self.rand.randrange(len(node.untried)))
+            player = game.current_player
+            game.move_bit(bit)
+            bits.append(bit)
+            child = Node(bit, player, node, get_untried(game))
+            node.children.append(child)
+            node = child
+            if virtual_loss:
+                node.visits += 1
+        return (node, bits)
+
+    def _backpropagate(self, node, red_reward, count, virtual_loss):
+        """Add the results of count rollouts to node and its ancestors."""
+        visits = count
+        if virtual_loss:
+            visits -= 1  # One was already counted by _select.
+        while node is not None:
+            node.visits += visits
+            if node.player == RED:
+                node.reward += red_reward
+            elif node.player == BLUE:
+                node.reward += count - red_reward
+            node = node.parent
+
+    def _iterate(self, game):
+        """Do one rollout, here in this process."""
+        (node, bits) = self._select(game, False)
+        red_reward = rollout(game, self.rand)
+        for bit in bits:
+            game.undo()
+        self._backpropagate(node, red_reward, 1, False)
+        self.rollouts += 1
+
+    def _iterate_batch(self, game, snapshot):
+        """Do a batch of rollouts in the pool."""
+        if self.pool is None:
+            self.pool = Pool(self.workers)
+        leaves = []
+        tasks = []
+        for i in range(self.workers * LEAVES_PER_WORKER):
+            (node, bits) = self._select(game, True)
+            for bit in bits:
+                game.undo()
+            leaves.append(node)
+            tasks.append((snapshot, bits, ROLLOUTS_PER_LEAF,
+                          self.rand.getrandbits(32)))
+        rewards = self.pool.map(run_rollouts, tasks)
+        for (node, red_reward) in zip(leaves, rewards):
+            self._backpropagate(node, red_reward, ROLLOUTS_PER_LEAF, True)
+        self.rollouts += len(tasks) * ROLLOUTS_PER_LEAF
@@ -5,6 +5,7 @@ See ../data/help.html for the rules.
 """
 
 from cStringIO import StringIO
+from operator import xor
 import random
 
 from pydispatch import dispatcher
@@ -20,11 +21,14 @@ SIZE = 3                        # The width of the board
 SQUARES_PER_LEVEL = SIZE ** 2
 TOTAL_SQUARES = SIZE ** 3
 SPECIAL_SQUARES = (1, 2, 6, 7)  # Remember, 0-based.
+MIN_SIZE = 3
+MAX_SIZE = 6                    # Its bits still fit in a byte.
 RANGE_SIZE = range(SIZE)
 RANGE_SIZE_REVERSED = range(SIZE)
 RANGE_SIZE_REVERSED.reverse()
 TICTACTOE_VALUE = 1
 SPECIAL_TICTACTOE_VALUE = 2
+ZOBRIST_SEED = 0x7171C7AC3
 
 STATUS_ONLY_UP = 'The only way is up!'
 STATUS_TIE = 'A tie!'
@@ -38,6 +42,22 @@ class Game:
 
     Here are some initial properties:
 
+    size
+      This is the width of the board.  It defaults to SIZE.
+
+    rules
+      These are the Rules for size.  They have all the tables that
+      depend on the size, such as the winning paths.
+
+    dispatcher
+      This is what I send signals through.  It defaults to the global
+      pydispatch dispatcher module, but anything with the same
+      ``hasReceivers`` and ``send`` functions will do, such as a
+      pydispatch.hub.SignalHub.  For instance, a server gives each
+      session its own hub, so that thousands of games don't pile up in
+      the global tables.  The default is a class attribute, so that
+      games can still be deep-copied and pickled.
+
     board
       This is a dict mapping tuples of the form ``(x, y, z)`` to
       instances of Square.  The z represents the level.
@@ -47,9 +67,10 @@ class Game:
       ``{RED: 0, BLUE: 0}``.
 
     move_count
-      This starts at 0 and ends at TOTAL_SQUARES.  Keeping a count makes
-      it easy to determine whose turn it is (if we know who's first),
-      what level we're on, and which moves result in special squares.
+      This starts at 0 and ends at ``rules.total_squares``.  Keeping a
+      count makes it easy to determine whose turn it is (if we know
+      who's first), what level we're on, and which moves result in
+      special squares.
 
     first_player
       Who gets to make the first move?
@@ -59,6 +80,24 @@ class Game:
       containing status messages.  It gets reset on every move.  The
       fmts are defined as constants above.
 
+    owners
+      This is a dict mapping RED and BLUE to a bit mask of the squares
+      they own.  See xyz_to_bit.  It mirrors board so that scoring
+      doesn't have to look at the Square objects.
+
+    specials
+      This is just like owners, but only for special squares.
+
+    keys
+      This is a list of 64-bit Zobrist hashes of the position, one per
+      symmetry in ``rules.symmetries``.  They're updated incrementally
+      on every move.  See canonical_key.
+
+    history
+      This is a list of entries of the form ``[xyz, points_earned, keys,
+      status]``, one per move.  keys and status are from before the
+      move.  Together with the Square, that's everything undo needs.
+
     The following pydispatch signals are sent:
 
     "LEVEL CHANGED"
@@ -77,19 +116,76 @@ class Game:
     "STATUS CHANGED"
       There are new status messages.
 
+    These are sent with the Square as the sender, so that each view
+    can connect to just its own square, instead of every view checking
+    on every move whether it was affected:
+
+    "SQUARE CHANGED"
+      The square's value or special flag may have changed.  On reset,
+      this is sent for every square that was cleared.
+
+    "SQUARE SCORED"
+      The square is part of a tic-tac-toe that was just made.
+
+    move, reset, and undo each send their signals as a batch; see
+    begin.  If the dispatcher has a ``sendBatch`` function, as
+    pydispatch's does, each receiver is called once per batch, after
+    everything has changed, with the named arguments of all of its
+    signals merged.  It gets the last of its signals as signal, and all
+    of them as signals.
+
+    batch
+      While a batch is open, this is a list of ``(signal, named)``
+      pairs, one per signal sent so far, where named is a dict of its
+      named arguments, merged as described in begin.  It's None if
+      there's no batch or nothing has been sent yet, so batches cost
+      next to nothing when no one is listening.
+
+    square_batch
+      This is like batch, but for the squares' signals.  It's a list of
+      ``(signal, square)`` pairs, each at most once.
+
+    square_queued
+      This is a set of the pairs in square_batch, so that checking for
+      one doesn't mean scanning the list.  It's None when square_batch
+      is.
+
+    batch_depth
+      This is how many times begin has been called without commit.
+
     """
 
-    def __init__(self, first_player=None):
+    dispatcher = dispatcher
+
+    def __init__(self, first_player=None, size=SIZE, dispatcher=None):
         """Initialize to defaults.
         
         first_player
           If None, I'll pick randomly.
 
+        size
+          This is the width of the board.  Raise a ValueError if it's
+          less than MIN_SIZE.
+
+        dispatcher
+          This is what to send signals through.  If None, I'll use the
+          global pydispatch dispatcher.
+
         """
+        if dispatcher is not None:
+            self.dispatcher = dispatcher
+        self.batch = None
+        self.square_batch = None
+        self.square_queued = None
+        self.batch_depth = 0
+        self.size = size
+        self.rules = get_rules(size)
         self.board = {}
         for xyz in self.iter_xyz():
             self.board[xyz] = Square(xyz)
         self.scores = {}
+        self.owners = {}
+        self.specials = {}
         self.reset(first_player)
 
     def reset(self, first_player=None):
@@ -101,16 +197,31 @@ class Game:
         """
         if first_player is None:
             first_player = random.choice([RED, BLUE])
+        self.begin()
+        try:
+            self._reset(first_player)
+        finally:
+            self.commit()
+
+    def _reset(self, first_player):
+        """This is the rest of reset, within a batch."""
         self.first_player = first_player
         for square in self.board.values():
-            square.reset()
+            if square.value != BLANK or square.special:
+                square.reset()
+                self._send_square("SQUARE CHANGED", square)
         for i in (RED, BLUE):
             self.scores[i] = 0
+            self.owners[i] = 0
+            self.specials[i] = 0
         self.move_count = 0
+        self.history = []
+        self.keys = ([self.rules.first_player_keys[first_player]] *
+                     len(self.rules.symmetries))
         self.status = []
         for signal in ("LEVEL CHANGED", "SCORE CHANGED", "BOARD CHANGED", 
                        "PLAYER CHANGED", "STATUS CHANGED"):
-            dispatcher.send(signal=signal, sender=self)
+            self._send(signal)
 
     def iter_xyz(self):
         """Iterate over every square on the board.
@@ -118,19 +229,16 @@ class Game:
         At each iteration, return ``(x, y, z)``.
 
         """
-        for x in RANGE_SIZE:
-            for y in RANGE_SIZE:
-                for z in RANGE_SIZE:
-                    yield (x, y, z)
+        return self.rules.iter_xyz()
 
     def __repr__(self):
         """Output the game state."""
         buf = StringIO()
-        for z in RANGE_SIZE_REVERSED:  # The only way is up!
+        for z in self.rules.range_size_reversed:  # The only way is up!
             buf.write('Level: %s\n' % (z + 1))
             buf.write('--------\n')
-            for y in RANGE_SIZE:
-                for x in RANGE_SIZE:
+            for y in self.rules.range_size:
+                for x in self.rules.range_size:
                     square = self.board[(x, y, z)]
                     buf.write(repr(square) + ' ')
                 buf.write('\n')
@@ -150,7 +258,7 @@ class Game:
         doc = """Is the game done?"""
 
         def fget(self):
-            return self.move_count == TOTAL_SQUARES
+            return self.move_count == self.rules.total_squares
 
         return locals()
     done = property(**done())
@@ -159,7 +267,7 @@ class Game:
         doc = """What level are we on?"""
 
         def fget(self):
-            return self.move_count // SQUARES_PER_LEVEL
+            return self.move_count // self.rules.squares_per_level
 
         return locals()
     current_level = property(**current_level())
@@ -181,7 +289,7 @@ class Game:
         doc = """Is the current move special?"""
 
         def fget(self):
-            return self.move_count % SQUARES_PER_LEVEL in SPECIAL_SQUARES
+            return self.rules.special_moves[self.move_count]
 
         return locals()
     current_move_special = property(**current_move_special())
@@ -201,6 +309,19 @@ class Game:
         return locals()
     winner = property(**winner())
 
+    def canonical_key():
+        doc = """Get a hash that's the same for all symmetric positions.
+
+        It's the smallest of ``self.keys``.  See also canonical_form.
+
+        """
+
+        def fget(self):
+            return min(self.keys)
+
+        return locals()
+    canonical_key = property(**canonical_key())
+
     def other_player(self, player):
         """Given a player, return the other player."""
         if player == RED:
@@ -222,16 +343,33 @@ class Game:
         square = self.board[(x, y, z)]
         if not square.value == BLANK:
             raise ValueError('Square taken')
+        self.begin()
+        try:
+            self._move(square)
+        finally:
+            self.commit()
+
+    def _move(self, square):
+        """This is the rest of move, within a batch."""
+        (x, y, z) = square.xyz
+        self.history.append([(x, y, z), 0, self.keys, self.status])
         self.status = []
         square.value = self.current_player
         square.special = self.current_move_special
-        dispatcher.send(signal="BOARD CHANGED", sender=self)
+        self._send_square("SQUARE CHANGED", square)
+        bit = self.rules.xyz_to_bit((x, y, z))
+        self.owners[square.value] |= 1 << bit
+        if square.special:
+            self.specials[square.value] |= 1 << bit
+        square_keys = self.rules.square_keys[square.value][square.special]
+        self.keys = map(xor, self.keys, square_keys[bit])
+        self._send("BOARD CHANGED")
         self._handle_tictactoe((x, y, z))
         self.move_count += 1
-        dispatcher.send(signal="PLAYER CHANGED", sender=self)
-        new_level = self.move_count % SQUARES_PER_LEVEL == 0
+        self._send("PLAYER CHANGED")
+        new_level = self.move_count % self.rules.squares_per_level == 0
         if new_level:
-            dispatcher.send(signal="LEVEL CHANGED", sender=self)
+            self._send("LEVEL CHANGED")
         if 0 < self.move_count and not self.done and new_level:
             self.status.append((STATUS_ONLY_UP, ()))
         if self.done:
@@ -240,82 +378,159 @@ class Game:
                 self.status.append((STATUS_TIE, ()))
             else:
                 self.status.append((STATUS_WINNER, (winner,)))
-        dispatcher.send(signal="STATUS CHANGED", sender=self)
+        self._send("STATUS CHANGED")
+
+    def undo(self):
+        """Take back the last move.
+
+        This restores exactly the state from before the move, including
+        the status, and sends the same signals a move would.  Raise an
+        IndexError if there's nothing to undo.
+
+        """
+        entry = self.history.pop()
+        self.begin()
+        try:
+            self._undo(entry)
+        finally:
+            self.commit()
+
+    def _undo(self, (xyz, points_earned, keys, status)):
+        """This is the rest of undo, within a batch."""
+        self.keys = keys
+        self.status = status
+        square = self.board[xyz]
+        player = square.value
+        bit = 1 << self.rules.xyz_to_bit(xyz)
+        self.owners[player] &= ~bit
+        self.specials[player] &= ~bit
+        square.reset()
+        self._send_square("SQUARE CHANGED", square)
+        self._send("BOARD CHANGED")
+        if points_earned:
+            self.scores[player] -= points_earned
+            self._send("SCORE CHANGED", xyzs_included=[])
+        self.move_count -= 1
+        self._send("PLAYER CHANGED")
+        if (self.move_count + 1) % self.rules.squares_per_level == 0:
+            self._send("LEVEL CHANGED")
+        self._send("STATUS CHANGED")
+
+    def begin(self):
+        """Start a batch of changes.
+
+        Until the matching commit, signals are queued instead of sent.
+        If the same signal is sent more than once, its named arguments
+        are merged.  Lists, such as xyzs_included, are concatenated, and
+        otherwise, later ones win.  Batches nest; only the outermost
+        commit sends anything.  For instance, to replay lots of moves
+        and only redraw once::
+
+          game.begin()
+          try:
+              for xyz in xyzs:
+                  game.move(xyz)
+          finally:
+              game.commit()
+
+        """
+        self.batch_depth += 1
+
+    def commit(self):
+        """Finish a batch of changes, and send the queued signals.
+
+        The squares' signals go first, so that by the time the game's
+        signals go out, the views of the squares are up to date.
+
+        """
+        self.batch_depth -= 1
+        if self.batch_depth:
+            return
+        squares = self.square_batch
+        signals = self.batch
+        self.square_batch = self.square_queued = self.batch = None
+        if squares is not None:
+            for (signal, square) in squares:
+                self.dispatcher.send(signal=signal, sender=square)
+        if signals is None:
+            return
+        send_batch = getattr(self.dispatcher, 'sendBatch', None)
+        if send_batch is not None:
+            send_batch(signals, sender=self)
+            return
+        for (signal, named) in signals:
+            self.dispatcher.send(signal=signal, sender=self, **named)
+
+    def _send(self, signal, **named):
+        """Send a pydispatch signal, but only if someone is listening.
+
+        When no view is attached, as in simulations, this is only a few
+        dict lookups per signal.  If a batch is open, queue it instead.
+
+        """
+        if not self.dispatcher.hasReceivers(self, signal):
+            return
+        if self.batch_depth:
+            batch = self.batch
+            if batch is None:
+                batch = self.batch = []
+            for (signal_, named_) in batch:
+                if signal_ == signal:
+                    for (name, value) in named.iteritems():
+                        queued = named_.get(name)
+                        if isinstance(value, list) and isinstance(queued,
+                                                                  list):
+                            value = queued + value
+                        named_[name] = value
+                    return
+            batch.append((signal, named))
+            return
+        self.dispatcher.send(signal=signal, sender=self, **named)
+
+    def _send_square(self, signal, square):
+        """Send a pydispatch signal from a square, like _send.
+
+        Within a batch, it's queued, but only once.
 
-    def _handle_tictactoe(self, (x, y, z)):
+        """
+        if not self.dispatcher.hasReceivers(square, signal):
+            return
+        if self.batch_depth:
+            batch = self.square_batch
+            if batch is None:
+                batch = self.square_batch = []
+                self.square_queued = set()
+            pair = (signal, square)
+            if pair not in self.square_queued:
+                self.square_queued.add(pair)
+                batch.append(pair)
+            return
+        self.dispatcher.send(signal=signal, sender=square)
+
+    def _handle_tictactoe(self, xyz):
         """Look for and handle instances of tic-tac-toe."""
-        if not hasattr(self, '_winning_paths'):
-            self._calc_winning_paths()
+        player = self.current_player
+        owned = self.owners[player]
+        specials = self.specials[player]
         points_earned = 0
         xyzs_included = []
-        for path in self._winning_paths:
-            (x_, y_, z_) = path[0]
-            if z < z_:
-                # The only way is up!
-                continue
-            if (x, y, z) not in path:
-                # Current point not in path
+        for (mask, path) in self.rules.paths_by_xyz[xyz]:
+            if owned & mask != mask:
                 continue
-            hits = 0
-            special_hits = 0
-            for xyz in path:
-                if self.board[xyz].value == self.current_player:
-                    hits += 1
-                    if self.board[xyz].special:
-                        special_hits += 1
-            if hits == SIZE:
-                xyzs_included.extend(path)
-            if special_hits == SIZE:  # Worth more, so check first.
+            xyzs_included.extend(path)
+            if specials & mask == mask:  # Worth more, so check first.
                 points_earned += SPECIAL_TICTACTOE_VALUE
-            elif hits == SIZE:
+            else:
                 points_earned += TICTACTOE_VALUE
         if points_earned:
-            self.scores[self.current_player] += points_earned
-            dispatcher.send(signal="SCORE CHANGED", sender=self,
-                            xyzs_included=xyzs_included)
+            self.scores[player] += points_earned
+            self.history[-1][1] = points_earned
+            self._send("SCORE CHANGED", xyzs_included=xyzs_included)
+            for xyz_ in xyzs_included:
+                self._send_square("SQUARE SCORED", self.board[xyz_])
             plural = points_earned != 1 and 's' or ''
             self.status.append((STATUS_POINTS_EARNED, (points_earned, plural)))
 
-    @classmethod
-    def _calc_winning_paths(cls):
-        """Set ``cls._winning_paths``.
-
-        This is a list of winning paths, which themselves are lists of
-        ``(x, y, z)`` tuples.  Each path is sorted so that the highest z
-        is always in the first tuple.  This is so that you can quickly
-        discover if you can skip the whole path.
-
-        """
-        paths = cls._winning_paths = []
-        # tic-tac-toe within a level
-        for z in RANGE_SIZE:
-            for y in RANGE_SIZE:
-                # Rows
-                paths.append([(x, y, z) for x in RANGE_SIZE])
-            for x in RANGE_SIZE:
-                # Columns
-                paths.append([(x, y, z) for y in RANGE_SIZE])
-            # Diagonals
-            paths.append([(i, i, z) for i in RANGE_SIZE])
-            paths.append([(invert(i), i, z) for i in RANGE_SIZE])
-        # tic-tac-toe across levels
-        for x in RANGE_SIZE:
-            for y in RANGE_SIZE:
-                # Vertical lines
-                paths.append([(x, y, z) for z in RANGE_SIZE_REVERSED])
-            # Column stairs
-            paths.append([(x, i, i) for i in RANGE_SIZE_REVERSED])
-            paths.append([(x, invert(i), i) for i in RANGE_SIZE_REVERSED])
-        for y in RANGE_SIZE:
-            # Row stairs
-            paths.append([(i, y, i) for i in RANGE_SIZE_REVERSED])
-            paths.append([(invert(i), y, i) for i in RANGE_SIZE_REVERSED])
-        # Diagonal stairs
-        paths.append([(i, i, i) for i in RANGE_SIZE_REVERSED])
-        paths.append([(i, invert(i), i) for i in RANGE_SIZE_REVERSED])
-        paths.append([(invert(i), i, i) for i in RANGE_SIZE_REVERSED])
-        paths.append([(invert(i), invert(i), i) for i in RANGE_SIZE_REVERSED])
-
 
 class Square:
 
@@ -351,11 +566,23 @@ class Square:
 
 class TextGame:
 
-    """This is a text-version of the game."""
+    """This is a text-version of the game.
 
-    def __init__(self):
+    The following attributes are used:
+
+    game
+      This is the Game.
+
+    computer_players
+      This is a dict mapping RED and/or BLUE to computer players, such
+      as mcts.MCTSPlayer.  Anyone else is asked for their moves.
+
+    """
+
+    def __init__(self, size=SIZE, computer_players=None):
         """Start the game."""
-        self.game = Game()
+        self.game = Game(size=size)
+        self.computer_players = computer_players or {}
 
     def run(self):
         """This is the game's main loop."""
@@ -384,9 +611,17 @@ class TextGame:
     def move(self):
         """Ask the user to make a move.
 
-        Validate it and then do it.
+        Validate it and then do it.  If it's a computer's turn, let it
+        pick instead.
 
         """
+        player = self.game.current_player
+        if player in self.computer_players:
+            xyz = self.computer_players[player].choose_move(self.game)
+            (x, y, z) = xyz
+            print '%s picks %s,%s' % (player, y + 1, x + 1)
+            self.game.move(xyz)
+            return
         fmt = 'Expected num,num'
         print ('%s, please enter row,col:' % self.game.current_player),
         nums = raw_input().split(',')
@@ -399,7 +634,7 @@ class TextGame:
             print fmt
             return self.move()
         for num in nums:
-            if num < 1 or 3 < num:
+            if num < 1 or self.game.size < num:
                 print 'Out of range:', num
                 return self.move()
         (row, col) = nums
@@ -411,14 +646,415 @@ class TextGame:
             return self.move()
 
 
+class Rules:
+
+    """These are the tables that the rules boil down to for a board size.
+
+    Don't create these directly.  Use get_rules, which caches them.
+
+    The following attributes are used:
+
+    size
+      This is the width of the board.  The board has size levels.
+
+    squares_per_level, total_squares, special_squares
+      These are just like the module constants of the same name, but
+      for this size.
+
+    range_size, range_size_reversed
+      Ditto.
+
+    special_moves
+      This is a tuple with an entry for every value of
+      ``Game.move_count`` saying whether that move is special.
+
+    winning_paths
+      This is a list of winning paths, which themselves are lists of
+      ``(x, y, z)`` tuples.  Each path is sorted so that the highest z
+      is always in the first tuple.
+
+    paths_by_xyz
+      This is a dict mapping each ``(x, y, z)`` to a tuple of ``(mask,
+      path)`` tuples, one for each winning path that a move on that
+      square can complete.  Since the only way is up, those are the
+      paths through the square whose highest z is the square's level.
+      The mask has a bit set for each square in the path.  See
+      xyz_to_bit.  The number of paths through a square grows much more
+      slowly than the number of paths, which is what keeps scoring cheap
+      on big boards.
+
+    lines_by_bit
+      This is the same as paths_by_xyz, except it's a tuple indexed by
+      bit, and it only has the masks.
+
+    symmetry_table, symmetries, inverse_symmetries
+      See _calc_symmetries.
+
+    owner_keys, special_keys, first_player_keys
+      See _calc_zobrist_keys.
+
+    square_keys
+      See _calc_square_keys.
+
+    """
+
+    def __init__(self, size):
+        """Calculate all the tables.
+
+        Raise a ValueError if the size is too small to play on.
+
+        """
+        if size < MIN_SIZE:
+            raise ValueError('The board must be at least %s wide' % MIN_SIZE)
+        self.size = size
+        self.squares_per_level = size ** 2
+        self.total_squares = size ** 3
+        self.special_squares = calc_special_squares(size)
+        self.range_size = range(size)
+        self.range_size_reversed = range(size)
+        self.range_size_reversed.reverse()
+        self.special_moves = tuple([
+            i % self.squares_per_level in self.special_squares
+            for i in range(self.total_squares + 1)])
+        self._calc_winning_paths()
+        (self.symmetry_table, self.symmetries) = self._calc_symmetries()
+        self.inverse_symmetries = tuple([
+            tuple([symmetry.index(bit) for bit in range(self.total_squares)])
+            for symmetry in self.symmetries])
+        (self.owner_keys, self.special_keys,
+         self.first_player_keys) = self._calc_zobrist_keys()
+        self.square_keys = self._calc_square_keys()
+
+    def invert(self, i):
+        """This is ``size - 1 - i``."""
+        return self.size - 1 - i
+
+    def xyz_to_bit(self, (x, y, z)):
+        """Given ``(x, y, z)``, return the square's bit number.
+
+        Squares are numbered ``x + y * size + z * squares_per_level``.
+        Bit number ``n`` of a mask is set if square ``n`` is included.
+
+        """
+        return x + y * self.size + z * self.squares_per_level
+
+    def bit_to_xyz(self, bit):
+        """Given a bit number, return ``(x, y, z)``."""
+        (z, rest) = divmod(bit, self.squares_per_level)
+        (y, x) = divmod(rest, self.size)
+        return (x, y, z)
+
+    def iter_xyz(self):
+        """Iterate over every square on the board.
+
+        At each iteration, return ``(x, y, z)``.
+
+        """
+        for x in self.range_size:
+            for y in self.range_size:
+                for z in self.range_size:
+                    yield (x, y, z)
+
+    def canonical_form(self, owners, specials, first_player):
+        """Return ``(key, symmetry_index)`` for the given position.
+
+        owners and specials are dicts like ``Game.owners`` and
+        ``Game.specials``.  key is the same for all positions that are
+        symmetric to each other.  It's the smallest of the Zobrist keys
+        of the position's symmetric images.  symmetry_index is the index
+        in symmetries of the symmetry that produced key.
+
+        This calculates everything from scratch.  See
+        ``Game.canonical_key`` for the incremental version.
+
+        """
+        keys = []
+        for symmetry in self.symmetries:
+            key = self.first_player_keys[first_player]
+            for player in (RED, BLUE):
+                owned = owners[player]
+                for bit in range(self.total_squares):
+                    if owned & (1 << bit):
+                        key ^= self.owner_keys[player][symmetry[bit]]
+                        if specials[player] & (1 << bit):
+                            key ^= self.special_keys[symmetry[bit]]
+            keys.append(key)
+        key = min(keys)
+        return (key, keys.index(key))
+
+    def _calc_winning_paths(self):
+        """Set winning_paths, paths_by_xyz, and lines_by_bit.
+
+        Whatever the size, there are rows, columns, and two diagonals
+        on each level.  Across levels, there are vertical lines, row and
+        column stairs, and the four diagonal stairs through the middle of
+        the cube.
+
+        """
+        invert = self.invert
+        range_size = self.range_size
+        range_size_reversed = self.range_size_reversed
+        paths = self.winning_paths = []
+        # tic-tac-toe within a level
+        for z in range_size:
+            for y in range_size:
+                # Rows
+                paths.append([(x, y, z) for x in range_size])
+            for x in range_size:
+                # Columns
+                paths.append([(x, y, z) for y in range_size])
+            # Diagonals
+            paths.append([(i, i, z) for i in range_size])
+            paths.append([(invert(i), i, z) for i in range_size])
+        # tic-tac-toe across levels
+        for x in range_size:
+            for y in range_size:
+                # Vertical lines
+                paths.append([(x, y, z) for z in range_size_reversed])
+            # Column stairs
+            paths.append([(x, i, i) for i in range_size_reversed])
+            paths.append([(x, invert(i), i) for i in range_size_reversed])
+        for y in range_size:
+            # Row stairs
+            paths.append([(i, y, i) for i in range_size_reversed])
+            paths.append([(invert(i), y, i) for i in range_size_reversed])
+        # Diagonal stairs
+        paths.append([(i, i, i) for i in range_size_reversed])
+        paths.append([(i, invert(i), i) for i in range_size_reversed])
+        paths.append([(invert(i), i, i) for i in range_size_reversed])
+        paths.append([(invert(i), invert(i), i) for i in range_size_reversed])
+        paths_by_xyz = {}
+        for path in paths:
+            mask = 0
+            for xyz in path:
+                mask |= 1 << self.xyz_to_bit(xyz)
+            (x_, y_, z_) = path[0]
+            for xyz in path:
+                if xyz[2] == z_:
+                    paths_by_xyz.setdefault(xyz, []).append((mask, path))
+        self.paths_by_xyz = {}
+        for (xyz, masks_and_paths) in paths_by_xyz.items():
+            self.paths_by_xyz[xyz] = tuple(masks_and_paths)
+        self.lines_by_bit = tuple([
+            tuple([mask for (mask, path) in
+                   self.paths_by_xyz[self.bit_to_xyz(bit)]])
+            for bit in range(self.total_squares)])
+
+    def _calc_symmetries(self):
+        """Return ``(symmetry_table, symmetries)``.
+
+        The candidates are the 8 symmetries of a single level, applied
+        to the whole stack at once, with and without turning the stack
+        upside down.  Each is checked against the winning paths: for
+        every square, the paths that a move on that square can complete
+        must map exactly onto the paths that a move on the image of that
+        square can complete.  Only then is scoring left intact.
+
+        Special squares don't need checking.  special_squares depends on
+        the move order, and whether a square ended up special is part of
+        the position, which moves along with the square.
+
+        symmetry_table
+          This is a list of tuples of the form ``(name, keeps_scoring)``,
+          one per candidate.
+
+        symmetries
+          This is a tuple of the symmetries that keep scoring intact,
+          starting with the identity.  Each is a tuple mapping each bit
+          to its image.
+
+        """
+        invert = self.invert
+        level_symmetries = (
+            ('identity', lambda x, y: (x, y)),
+            ('rotate 90', lambda x, y: (invert(y), x)),
+            ('rotate 180', lambda x, y: (invert(x), invert(y))),
+            ('rotate 270', lambda x, y: (y, invert(x))),
+            ('flip x', lambda x, y: (invert(x), y)),
+            ('flip y', lambda x, y: (x, invert(y))),
+            ('transpose', lambda x, y: (y, x)),
+            ('anti-transpose', lambda x, y: (invert(y), invert(x))))
+        symmetry_table = []
+        symmetries = []
+        for upside_down in (False, True):
+            for (name, transform) in level_symmetries:
+                if upside_down:
+                    name += ', upside down'
+                symmetry = [None] * self.total_squares
+                for (x, y, z) in self.iter_xyz():
+                    z_ = z
+                    if upside_down:
+                        z_ = invert(z)
+                    image = transform(x, y) + (z_,)
+                    symmetry[self.xyz_to_bit((x, y, z))] = \
+                        self.xyz_to_bit(image)
+                keeps_scoring = True
+                for (xyz, masks_and_paths) in self.paths_by_xyz.items():
+                    image = self.bit_to_xyz(symmetry[self.xyz_to_bit(xyz)])
+                    expected = [mask for (mask, path) in
+                                self.paths_by_xyz[image]]
+                    actual = [apply_symmetry(symmetry, mask)
+                              for (mask, path) in masks_and_paths]
+                    expected.sort()
+                    actual.sort()
+                    if actual != expected:
+                        keeps_scoring = False
+                        break
+                symmetry_table.append((name, keeps_scoring))
+                if keeps_scoring:
+                    symmetries.append(tuple(symmetry))
+        return (symmetry_table, tuple(symmetries))
+
+    def _calc_zobrist_keys(self):
+        """Return ``(owner_keys, special_keys, first_player_keys)``.
+
+        owner_keys
+          This is a dict mapping RED and BLUE to a tuple with one random
+          64-bit key per bit.
+
+        special_keys
+          This is a tuple with one random 64-bit key per bit.
+
+        first_player_keys
+          This is a dict mapping RED and BLUE to a random 64-bit key.
+          It's needed because whose turn it is depends on who went
+          first.
+
+        I use a fixed seed so that keys are stable across runs.  Hence,
+        they're safe to write to disk.
+
+        """
+        rand = random.Random(ZOBRIST_SEED + self.size)
+        owner_keys = {}
+        first_player_keys = {}
+        for player in (RED, BLUE):
+            owner_keys[player] = tuple([rand.getrandbits(64)
+                                        for i in range(self.total_squares)])
+            first_player_keys[player] = rand.getrandbits(64)
+        special_keys = tuple([rand.getrandbits(64)
+                              for i in range(self.total_squares)])
+        return (owner_keys, special_keys, first_player_keys)
+
+    def _calc_square_keys(self):
+        """Return the table used to update Zobrist keys incrementally.
+
+        It's a dict mapping RED and BLUE to a pair of tuples, the first
+        for normal squares and the second for special squares.  Each of
+        those has an entry per bit, which is a tuple with one key per
+        symmetry.  XOR it into ``Game.keys`` when the player takes (or
+        gives back) the square.
+
+        """
+        square_keys = {}
+        for player in (RED, BLUE):
+            pair = []
+            for special in (False, True):
+                per_bit = []
+                for bit in range(self.total_squares):
+                    keys = []
+                    for symmetry in self.symmetries:
+                        key = self.owner_keys[player][symmetry[bit]]
+                        if special:
+                            key ^= self.special_keys[symmetry[bit]]
+                        keys.append(key)
+                    per_bit.append(tuple(keys))
+                pair.append(tuple(per_bit))
+            square_keys[player] = tuple(pair)
+        return square_keys
+
+
+def get_rules(size=SIZE):
+    """Return the Rules for the given board size.
+
+    They're only calculated once per size.
+
+    """
+    if size not in get_rules.cache:
+        get_rules.cache[size] = Rules(size)
+    return get_rules.cache[size]
+
+get_rules.cache = {}
+
+
+def calc_special_squares(size):
+    """Return the special squares for a board of the given size.
+
+    Like SPECIAL_SQUARES, these are 0-based move numbers within a level.
+    For the standard board, they're just SPECIAL_SQUARES.  Otherwise,
+    they come in pairs of back-to-back moves so that both players get
+    the same number of special squares.  There are about 4 special
+    squares for every 9 squares, spread evenly across the level, which
+    is what SPECIAL_SQUARES does for the standard board.
+
+    """
+    if size == SIZE:
+        return SPECIAL_SQUARES
+    squares_per_level = size ** 2
+    pairs = 4 * squares_per_level // 18
+    special_squares = []
+    for i in range(pairs):
+        first = 1 + i * (squares_per_level - 4) // (pairs - 1)
+        special_squares.extend([first, first + 1])
+    return tuple(special_squares)
+
+
 def invert(i):
     """This is ``SIZE - 1 - i``."""
     return SIZE - 1 - i
 
 
-def main():
-    """``TextGame().run()``"""
-    TextGame().run()
+def xyz_to_bit((x, y, z)):
+    """Given ``(x, y, z)``, return the square's bit number.
+
+    Squares are numbered ``x + y * SIZE + z * SQUARES_PER_LEVEL``.  Bit
+    number ``n`` of a mask is set if square ``n`` is included.  This is
+    for the standard board.  See ``Rules.xyz_to_bit`` for other sizes.
+
+    """
+    return x + y * SIZE + z * SQUARES_PER_LEVEL
+
+
+def bit_to_xyz(bit):
+    """Given a bit number, return ``(x, y, z)``.
+
+    This is for the standard board.  See ``Rules.bit_to_xyz`` for other
+    sizes.
+
+    """
+    (z, rest) = divmod(bit, SQUARES_PER_LEVEL)
+    (y, x) = divmod(rest, SIZE)
+    return (x, y, z)
+
+
+def apply_symmetry(symmetry, mask):
+    """Given a symmetry and a mask, return the new mask."""
+    result = 0
+    bit = 0
+    while mask:
+        if mask & 1:
+            result |= 1 << symmetry[bit]
+        mask >>= 1
+        bit += 1
+    return result
+
+
+def canonical_form(owners, specials, first_player):
+    """This is ``RULES.canonical_form``, for the standard board."""
+    return RULES.canonical_form(owners, specials, first_player)
+
+RULES = get_rules(SIZE)
+SYMMETRY_TABLE = RULES.symmetry_table
+SYMMETRIES = RULES.symmetries
+INVERSE_SYMMETRIES = RULES.inverse_symmetries
+OWNER_KEYS = RULES.owner_keys
+SPECIAL_KEYS = RULES.special_keys
+FIRST_PLAYER_KEYS = RULES.first_player_keys
+SQUARE_KEYS = RULES.square_keys
+
+
+def main(computer_players=None):
+    """``TextGame(computer_players=computer_players).run()``"""
+    TextGame(computer_players=computer_players).run()
 
 
 if __name__ == '__main__':
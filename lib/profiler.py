@@ -0,0 +1,248 @@
+"""This is an opt-in profiler for finding frame-time spikes.
+
+It's off unless the TICTACTOE3_PROFILE environment variable is set::
+
+  TICTACTOE3_PROFILE=1 python run_game.py
+
+When it's on, ``pydispatch.dispatcher.send`` and ``sendBatch`` are
+replaced with versions that time each signal, or batch of signals, and
+each receiver they call, and the main loop times each phase of every
+frame.  On exit, a summary is printed to stderr.  If TICTACTOE3_PROFILE
+is set to anything other than "1", it's taken as a filename, and the
+timings are also written there as collapsed stacks, in microseconds,
+which is what flamegraph.pl wants::
+
+  TICTACTOE3_PROFILE=stacks.txt python run_game.py
+  flamegraph.pl stacks.txt > stacks.svg
+
+There's a singleton instance called "profiler".  When the profiler is
+off, it's a NullProfiler, whose methods do nothing, and the dispatcher
+isn't touched at all.
+
+It's only meant for the thread that runs the event loop.
+
+"""
+
+import atexit
+import os
+import sys
+from timeit import default_timer
+
+from pydispatch import dispatcher
+from pydispatch.dispatcher import Any, Anonymous
+from pydispatch.robustapply import subset
+
+__docformat__ = 'restructuredtext'
+
+ENVIRONMENT_VARIABLE = 'TICTACTOE3_PROFILE'
+
+
+class NullProfiler:
+
+    """This is what you get when profiling is off.  It does nothing."""
+
+    def begin(self, name):
+        pass
+
+    def end(self):
+        pass
+
+    def install(self):
+        pass
+
+
+class Profiler:
+
+    """Time nested sections of code.
+
+    Call begin with the name of a section, and end when it's done.
+    Sections nest, and each one is identified by its path, i.e. its
+    name and the names of the sections it's in.
+
+    The following attributes are used:
+
+    stats
+      This is a dict mapping each path, a tuple of names, to a list
+      of the form ``[count, total, self_time, longest]``, in seconds.
+      self_time leaves out the time spent in nested sections.
+
+    stack
+      This is a list of the open sections.  Each is a list of the form
+      ``[path, start, time_in_nested_sections]``.
+
+    filename
+      If not None, dump writes collapsed stacks here.
+
+    """
+
+    def __init__(self, filename=None):
+        self.stats = {}
+        self.stack = []
+        self.filename = filename
+        self.original_send = None
+        self.original_send_batch = None
+
+    def begin(self, name):
+        """Start timing a section."""
+        stack = self.stack
+        if stack:
+            path = stack[-1][0] + (name,)
+        else:
+            path = (name,)
+        stack.append([path, default_timer(), 0.0])
+
+    def end(self):
+        """Stop timing the most recently begun section."""
+        (path, start, nested) = self.stack.pop()
+        elapsed = default_timer() - start
+        stats = self.stats.get(path)
+        if stats is None:
+            stats = self.stats[path] = [0, 0.0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] += elapsed - nested
+        if elapsed > stats[3]:
+            stats[3] = elapsed
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def install(self):
+        """Replace dispatcher.send and sendBatch, and dump at exit."""
+        if self.original_send is not None:
+            return
+        self.original_send = dispatcher.send
+        self.original_send_batch = dispatcher.sendBatch
+        dispatcher.send = self.send
+        dispatcher.sendBatch = self.send_batch
+        atexit.register(self.dump)
+
+    def send(self, signal=Any, sender=Anonymous, *arguments, **named):
+        """Do what dispatcher.send does, but time each receiver.
+
+        Each signal is a section named ``send SIGNAL``, and each
+        receiver is a section within it.
+
+        """
+        self.begin('send %s' % (signal,))
+        try:
+            if arguments:
+                return self.original_send(signal, sender, *arguments,
+                                          **named)
+            named['signal'] = signal
+            named['sender'] = sender
+            calls = []
+            for (receiver, weak, acceptable) in dispatcher._getPlan(
+                    sender, signal):
+                if weak:
+                    receiver = receiver()
+                    if receiver is None:
+                        continue
+                calls.append((receiver, subset(named, acceptable)))
+            return self._call(calls)
+        finally:
+            self.end()
+
+    def send_batch(self, signals, sender=Anonymous):
+        """Do what dispatcher.sendBatch does, but time each receiver.
+
+        Each batch is a section named ``batch SIGNAL,SIGNAL,...``.
+
+        """
+        self.begin('batch %s' % ','.join([str(signal)
+                                          for (signal, named) in signals]))
+        try:
+            names = tuple([signal for (signal, named) in signals])
+            plan = dispatcher._getBatchPlan(sender, names)
+            return self._call(dispatcher._batchCalls(plan, signals, sender))
+        finally:
+            self.end()
+
+    def _call(self, calls):
+        """Make the ``(receiver, named)`` calls, timing each one."""
+        responses = []
+        for (receiver, named) in calls:
+            self.begin(get_name(receiver))
+            try:
+                response = receiver(**named)
+            finally:
+                self.end()
+            responses.append((receiver, response))
+        return responses
+
+    def summarize(self):
+        """Return the summary as a list of lines.
+
+        The sections are shown as a tree, and within each level, the
+        ones that took the most time come first.
+
+        """
+        lines = ['%-56s %8s %10s %10s %9s %9s' %
+                 ('section', 'count', 'total ms', 'self ms', 'mean ms',
+                  'max ms')]
+        children = {}
+        for path in self.stats:
+            children.setdefault(path[:-1], []).append(path)
+
+        def walk(parent):
+            paths = children.get(parent, [])
+            paths.sort(key=lambda path: -self.stats[path][1])
+            for path in paths:
+                (count, total, self_time, longest) = self.stats[path]
+                name = '  ' * (len(path) - 1) + path[-1]
+                lines.append('%-56s %8d %10.1f %10.1f %9.3f %9.3f' %
+                             (name[:56], count, total * 1e3, self_time * 1e3,
+                              total * 1e3 / count, longest * 1e3))
+                walk(path)
+
+        walk(())
+        return lines
+
+    def write_stacks(self, f):
+        """Write the self times as collapsed stacks, in microseconds."""
+        for (path, stats) in sorted(self.stats.items()):
+            usec = int(stats[2] * 1e6)
+            if usec:
+                f.write('%s %d\n' % (';'.join(path), usec))
+
+    def dump(self):
+        """Print the summary, and write the stacks if there's a file."""
+        print >> sys.stderr, '\n'.join(self.summarize())
+        if self.filename is not None:
+            f = open(self.filename, 'w')
+            try:
+                self.write_stacks(f)
+            finally:
+                f.close()
+
+
+def get_name(receiver):
+    """Return a name like "view.Ball.handle_square_changed"."""
+    im_self = getattr(receiver, 'im_self', None)
+    if im_self is not None:
+        cls = im_self.__class__
+        return '%s.%s.%s' % (cls.__module__, cls.__name__,
+                             receiver.im_func.__name__)
+    module = getattr(receiver, '__module__', None)
+    name = getattr(receiver, '__name__', None)
+    if module is None or name is None:
+        return repr(receiver)
+    return '%s.%s' % (module, name)
+
+
+def get_profiler(setting=None):
+    """Return a Profiler if setting says so, otherwise a NullProfiler.
+
+    setting
+      If None, I'll use the TICTACTOE3_PROFILE environment variable.
+
+    """
+    if setting is None:
+        setting = os.environ.get(ENVIRONMENT_VARIABLE)
+    if not setting or setting == '0':
+        return NullProfiler()
+    if setting == '1':
+        return Profiler()
+    return Profiler(setting)
+
+
+profiler = get_profiler()
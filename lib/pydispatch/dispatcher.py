@@ -24,6 +24,11 @@ Internal attributes:
 		used for cleaning up receiver references on receiver
 		deletion, (considerably speeds up the cleanup process
 		vs. the original code.)
+	plans -- { (senderkey (id) or None, signal) : [(receiver, weak, acceptable)...]}
+		cache of the receivers send will call for a given
+		sender and signal, see _getPlan.  It also holds the
+		plans for sendBatch, see _getBatchPlan.  It is cleared
+		whenever the routing tables change.
 """
 from __future__ import generators
 import types, weakref
@@ -79,6 +84,7 @@ WEAKREF_TYPES = (weakref.ReferenceType, saferef.BoundMethodWeakref)
 connections = {}
 senders = {}
 sendersBack = {}
+plans = {}
 
 
 def connect(receiver, signal=Any, sender=Any, weak=True):
@@ -137,6 +143,7 @@ def connect(receiver, signal=Any, sender=Any, weak=True):
 		raise errors.DispatcherTypeError(
 			'Signal cannot be None (receiver=%r sender=%r)'%( receiver,sender)
 		)
+	plans.clear()
 	if weak:
 		receiver = saferef.safeRef(receiver, onDelete=_removeReceiver)
 	senderkey = id(sender)
@@ -208,6 +215,7 @@ def disconnect(receiver, signal=Any, sender=Any, weak=True):
 		raise errors.DispatcherTypeError(
 			'Signal cannot be None (receiver=%r sender=%r)'%( receiver,sender)
 		)
+	plans.clear()
 	if weak: receiver = saferef.safeRef(receiver)
 	senderkey = id(sender)
 	try:
@@ -256,6 +264,22 @@ def getReceivers( sender = Any, signal = Any ):
 	except KeyError:
 		return []
 
+def hasReceivers( sender = Any, signal = Any ):
+	"""Could anything receive the given signal from sender?
+
+	This is a cheap check, a handful of dictionary lookups,
+	which lets a sender skip building and sending a signal
+	altogether when nothing is listening.  It may return
+	true for receivers which have died but not yet been
+	cleaned up, but it never returns false if send would
+	reach a receiver.
+	"""
+	for senderkey in (id(sender), id(Any)):
+		signals = connections.get(senderkey)
+		if signals and (signals.has_key(signal) or signals.has_key(Any)):
+			return True
+	return False
+
 def liveReceivers(receivers):
 	"""Filter sequence of receivers to get resolved, live receivers
 
@@ -340,16 +364,177 @@ def send(signal=Any, sender=Anonymous, *arguments, **named):
 	# Call each receiver with whatever arguments it can accept.
 	# Return a list of tuple pairs [(receiver, response), ... ].
 	responses = []
-	for receiver in liveReceivers(getAllReceivers(sender, signal)):
-		response = robustapply.robustApply(
-			receiver,
-			signal=signal,
-			sender=sender,
-			*arguments,
-			**named
-		)
+	if arguments:
+		# Positional arguments change which names are acceptable,
+		# so don't bother with the cached plan.
+		for receiver in liveReceivers(getAllReceivers(sender, signal)):
+			response = robustapply.robustApply(
+				receiver,
+				signal=signal,
+				sender=sender,
+				*arguments,
+				**named
+			)
+			responses.append((receiver, response))
+		return responses
+	named['signal'] = signal
+	named['sender'] = sender
+	for receiver, weak, acceptable in _getPlan(sender, signal):
+		if weak:
+			receiver = receiver()
+			if receiver is None:
+				continue
+		response = receiver(**robustapply.subset(named, acceptable))
 		responses.append((receiver, response))
 	return responses
+
+def _getPlan(sender, signal):
+	"""Get the cached list of receivers for sender and signal
+
+	Each item is a tuple (receiver, weak, acceptable), where
+	weak says whether receiver is a weak reference that
+	must be dereferenced, and acceptable is the frozenset of
+	keyword argument names the receiver accepts, or None
+	if it accepts any (**named).  See robustapply.signature.
+
+	Senders with no connections of their own share a plan,
+	since only receivers registered for Any sender apply.
+	That keeps the cache from growing with every sender.
+	"""
+	senderkey = id(sender)
+	if not connections.has_key(senderkey):
+		senderkey = None
+	try:
+		return plans[(senderkey, signal)]
+	except KeyError:
+		pass
+	plan = []
+	for item in getAllReceivers(sender, signal):
+		weak = isinstance(item, WEAKREF_TYPES)
+		if weak:
+			receiver = item()
+			if receiver is None:
+				continue
+		else:
+			receiver = item
+		plan.append((item, weak, _getAcceptable(receiver)))
+	plans[(senderkey, signal)] = plan
+	return plan
+
+def sendBatch(signals, sender=Anonymous):
+	"""Send several signals from sender, calling each receiver once
+
+	signals -- list of (signal, named) pairs, in the order
+		they happened, where named is a dictionary of the
+		named arguments for that signal
+
+	sender -- the sender of the signals, see send
+
+	Each receiver which would receive any of the signals is
+	called once, in the order it would first have been called
+	had the signals been sent one by one.  Its named arguments
+	are those of all of its signals merged, with later ones
+	winning, plus signal, which is the last of its signals,
+	and signals, which is a tuple of them.  This is for
+	senders that change several things at once, so that a
+	receiver which listens for several of the signals only
+	reacts once.
+
+	Return a list of tuple pairs [(receiver, response), ... ]
+	"""
+	names = tuple([signal for signal, named in signals])
+	responses = []
+	for receiver, named in _batchCalls(
+		_getBatchPlan(sender, names), signals, sender
+	):
+		responses.append((receiver, receiver(**named)))
+	return responses
+
+def _getBatchPlan(sender, names):
+	"""Get the cached batch plan for sender and signal names
+
+	Batch plans are kept in plans, keyed by (senderkey or None,
+	None, names); no signal is None, so they can't be confused
+	with the plans of single signals.  See _planBatch.
+	"""
+	senderkey = id(sender)
+	if not connections.has_key(senderkey):
+		senderkey = None
+	key = (senderkey, None, names)
+	try:
+		return plans[key]
+	except KeyError:
+		pass
+	plan = plans[key] = _planBatch(_getPlan, sender, names)
+	return plan
+
+def _planBatch(getPlan, sender, names):
+	"""Work out which receivers get which of the signals
+
+	getPlan -- function returning the plan for sender and
+		signal, see _getPlan
+
+	Returns a list of (receiver, weak, acceptable, indexes,
+	signals), one per receiver, where indexes are the
+	positions in names of its signals, and signals are
+	those names.
+	"""
+	entries = {}
+	plan = []
+	for index, signal in enumerate(names):
+		for item, weak, acceptable in getPlan(sender, signal):
+			if weak:
+				receiver = item()
+				if receiver is None:
+					continue
+			else:
+				receiver = item
+			key = _receiverKey(receiver)
+			entry = entries.get(key)
+			if entry is None:
+				entry = entries[key] = (item, weak, acceptable, [])
+				plan.append(entry)
+			entry[3].append(index)
+	return [
+		(item, weak, acceptable, indexes, tuple([names[i] for i in indexes]))
+		for item, weak, acceptable, indexes in plan
+	]
+
+def _batchCalls(plan, signals, sender):
+	"""Get the (receiver, named) calls for a batch plan"""
+	calls = []
+	for receiver, weak, acceptable, indexes, names in plan:
+		if weak:
+			receiver = receiver()
+			if receiver is None:
+				continue
+		named = {}
+		for index in indexes:
+			named.update(signals[index][1])
+		named['signal'] = names[-1]
+		named['sender'] = sender
+		named['signals'] = names
+		calls.append((receiver, robustapply.subset(named, acceptable)))
+	return calls
+
+def _receiverKey(receiver):
+	"""Get the identity key for a receiver
+
+	Bound methods are recreated on every attribute access,
+	so they're identified by their object and function,
+	as saferef.BoundMethodWeakref does.
+	"""
+	if getattr(receiver, 'im_self', None) is not None:
+		return (id(receiver.im_self), id(receiver.im_func))
+	return id(receiver)
+
+def _getAcceptable(receiver):
+	"""Get the frozenset of keyword argument names receiver accepts
+
+	Returns None if it accepts any (**named).
+	"""
+	return robustapply.signature(receiver)[1]
+
 def sendExact( signal=Any, sender=Anonymous, *arguments, **named ):
 	"""Send signal only to those receivers registered for exact message
 
@@ -376,6 +561,7 @@ def _removeReceiver(receiver):
 	if not sendersBack:
 		# During module cleanup the mapping will be replaced with None
 		return False
+	plans.clear()
 	backKey = id(receiver)
 	for senderkey in sendersBack.get(backKey,()):
 		try:
@@ -420,6 +606,7 @@ def _cleanupConnections(senderkey, signal):
 
 def _removeSender(senderkey):
 	"""Remove senderkey from connections."""
+	plans.clear()
 	_removeBackrefs(senderkey)
 	try:
 		del connections[senderkey]
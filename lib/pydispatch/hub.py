@@ -0,0 +1,283 @@
+"""Instance-scoped signal dispatching
+
+SignalHub offers the same connect/disconnect/send API as the
+dispatcher module, but its routing tables belong to the hub
+instead of to the module.  Give each game or session its own
+hub, and its routes live and die with it:
+
+	hub = SignalHub()
+	game = model.Game(dispatcher=hub)
+	hub.connect(receiver, signal='BOARD CHANGED', sender=game)
+
+Routes are stored in dictionaries keyed by receiver, so a
+receiver is removed in O(1) per route rather than by scanning
+lists.  The weak-reference callbacks only hold the hub weakly,
+so when a hub goes away, its tables are simply freed; nothing
+global has to be walked or cleaned up.
+
+Internal attributes:
+	connections -- { senderkey (id) : { signal : { receiverkey : receiver }}}
+		receiver is the weak reference, or the receiver
+		itself if it was connected with weak=False.  The
+		innermost dictionaries preserve connection order.
+	senders -- { senderkey (id) : weakref(sender) }
+	routes -- { receiverkey : set([(senderkey, signal)...]) }
+		the reverse of connections, used to remove a
+		receiver's routes when it is garbage collected
+	plans -- { (senderkey (id) or None, signal) : [(receiver, weak, acceptable)...]}
+		see dispatcher._getPlan and dispatcher._getBatchPlan
+"""
+import weakref
+try:
+	from collections import OrderedDict
+except ImportError:
+	OrderedDict = None
+from pydispatch import saferef, robustapply, errors
+from pydispatch.dispatcher import Any, Anonymous, WEAKREF_TYPES
+from pydispatch.dispatcher import _getAcceptable, _planBatch, _batchCalls
+from pydispatch.dispatcher import _receiverKey
+
+class SignalHub(object):
+	"""A dispatcher whose routing tables belong to the instance"""
+	def __init__(self):
+		"""Start with no routes"""
+		self.connections = {}
+		self.senders = {}
+		self.routes = {}
+		self.plans = {}
+
+	def connect(self, receiver, signal=Any, sender=Any, weak=True):
+		"""Connect receiver to sender for signal
+
+		See dispatcher.connect for the details.  Connecting
+		the same receiver twice for the same signal and
+		sender replaces the first connection.
+		"""
+		if signal is None:
+			raise errors.DispatcherTypeError(
+				'Signal cannot be None (receiver=%r sender=%r)'%( receiver,sender)
+			)
+		self.plans.clear()
+		receiverKey = _receiverKey(receiver)
+		if weak:
+			hubRef = weakref.ref(self)
+			def onDelete(reference, receiverKey=receiverKey):
+				hub = hubRef()
+				if hub is not None:
+					hub._removeReceiver(receiverKey)
+			receiver = saferef.safeRef(receiver, onDelete=onDelete)
+		senderkey = id(sender)
+		signals = self.connections.get(senderkey)
+		if signals is None:
+			signals = self.connections[senderkey] = {}
+			if sender not in (None, Anonymous, Any):
+				hubRef = weakref.ref(self)
+				def remove(object, senderkey=senderkey):
+					hub = hubRef()
+					if hub is not None:
+						hub._removeSender(senderkey)
+				# Objects that can not be weakly referenced
+				# won't be cleaned up automatically.
+				try:
+					self.senders[senderkey] = weakref.ref(sender, remove)
+				except TypeError:
+					pass
+		receivers = signals.get(signal)
+		if receivers is None:
+			receivers = signals[signal] = _newReceivers()
+		elif receivers.has_key(receiverKey):
+			del receivers[receiverKey]
+		receivers[receiverKey] = receiver
+		self.routes.setdefault(receiverKey, set()).add((senderkey, signal))
+
+	def disconnect(self, receiver, signal=Any, sender=Any, weak=True):
+		"""Disconnect receiver from sender for signal
+
+		Raise DispatcherKeyError if it wasn't connected.
+		"""
+		if signal is None:
+			raise errors.DispatcherTypeError(
+				'Signal cannot be None (receiver=%r sender=%r)'%( receiver,sender)
+			)
+		receiverKey = _receiverKey(receiver)
+		senderkey = id(sender)
+		try:
+			del self.connections[senderkey][signal][receiverKey]
+		except KeyError:
+			raise errors.DispatcherKeyError(
+				"""No connection to receiver %s for signal %s from sender %s""" %(
+					receiver,
+					signal,
+					sender
+				)
+			)
+		self.plans.clear()
+		self._forgetRoute(receiverKey, senderkey, signal)
+		self._cleanupConnections(senderkey, signal)
+
+	def hasReceivers(self, sender=Any, signal=Any):
+		"""Could anything receive the given signal from sender?
+
+		See dispatcher.hasReceivers.
+		"""
+		connections = self.connections
+		for senderkey in (id(sender), id(Any)):
+			signals = connections.get(senderkey)
+			if signals and (signals.has_key(signal) or signals.has_key(Any)):
+				return True
+		return False
+
+	def getAllReceivers(self, sender=Any, signal=Any):
+		"""Generate the receivers for sender and signal, each once
+
+		Like dispatcher.getAllReceivers, this produces weak
+		references as they are stored.
+		"""
+		seen = {}
+		for senderkey, signal_ in (
+			(id(sender), signal),
+			(id(sender), Any),
+			(id(Any), signal),
+			(id(Any), Any),
+		):
+			try:
+				receivers = self.connections[senderkey][signal_]
+			except KeyError:
+				continue
+			for receiverKey, receiver in receivers.items():
+				if not seen.has_key(receiverKey):
+					seen[receiverKey] = 1
+					yield receiver
+
+	def send(self, signal=Any, sender=Anonymous, *arguments, **named):
+		"""Send signal from sender to all connected receivers
+
+		See dispatcher.send.
+		"""
+		responses = []
+		if arguments:
+			for receiver in self.getAllReceivers(sender, signal):
+				if isinstance(receiver, WEAKREF_TYPES):
+					receiver = receiver()
+					if receiver is None:
+						continue
+				response = robustapply.robustApply(
+					receiver,
+					signal=signal,
+					sender=sender,
+					*arguments,
+					**named
+				)
+				responses.append((receiver, response))
+			return responses
+		named['signal'] = signal
+		named['sender'] = sender
+		for receiver, weak, acceptable in self._getPlan(sender, signal):
+			if weak:
+				receiver = receiver()
+				if receiver is None:
+					continue
+			response = receiver(**robustapply.subset(named, acceptable))
+			responses.append((receiver, response))
+		return responses
+
+	def sendBatch(self, signals, sender=Anonymous):
+		"""Send several signals from sender, calling each receiver once
+
+		See dispatcher.sendBatch.
+		"""
+		names = tuple([signal for signal, named in signals])
+		responses = []
+		for receiver, named in _batchCalls(
+			self._getBatchPlan(sender, names), signals, sender
+		):
+			responses.append((receiver, receiver(**named)))
+		return responses
+
+	def _getPlan(self, sender, signal):
+		"""Get the cached list of receivers for sender and signal
+
+		See dispatcher._getPlan.
+		"""
+		senderkey = id(sender)
+		if not self.connections.has_key(senderkey):
+			senderkey = None
+		try:
+			return self.plans[(senderkey, signal)]
+		except KeyError:
+			pass
+		plan = []
+		for item in self.getAllReceivers(sender, signal):
+			weak = isinstance(item, WEAKREF_TYPES)
+			if weak:
+				receiver = item()
+				if receiver is None:
+					continue
+			else:
+				receiver = item
+			plan.append((item, weak, _getAcceptable(receiver)))
+		self.plans[(senderkey, signal)] = plan
+		return plan
+
+	def _getBatchPlan(self, sender, names):
+		"""Get the cached batch plan for sender and signal names
+
+		See dispatcher._getBatchPlan.
+		"""
+		senderkey = id(sender)
+		if not self.connections.has_key(senderkey):
+			senderkey = None
+		key = (senderkey, None, names)
+		try:
+			return self.plans[key]
+		except KeyError:
+			pass
+		plan = self.plans[key] = _planBatch(self._getPlan, sender, names)
+		return plan
+
+	def _removeReceiver(self, receiverKey):
+		"""Remove all of a dead receiver's routes"""
+		self.plans.clear()
+		for senderkey, signal in self.routes.pop(receiverKey, ()):
+			try:
+				del self.connections[senderkey][signal][receiverKey]
+			except KeyError:
+				pass
+			else:
+				self._cleanupConnections(senderkey, signal)
+
+	def _removeSender(self, senderkey):
+		"""Remove all of a dead sender's routes"""
+		self.plans.clear()
+		self.senders.pop(senderkey, None)
+		signals = self.connections.pop(senderkey, {})
+		for signal, receivers in signals.items():
+			for receiverKey in receivers.keys():
+				self._forgetRoute(receiverKey, senderkey, signal)
+
+	def _forgetRoute(self, receiverKey, senderkey, signal):
+		"""Remove one entry from routes"""
+		routes = self.routes.get(receiverKey)
+		if routes is not None:
+			routes.discard((senderkey, signal))
+			if not routes:
+				del self.routes[receiverKey]
+
+	def _cleanupConnections(self, senderkey, signal):
+		"""Delete signal for senderkey if empty, and senderkey if empty"""
+		signals = self.connections.get(senderkey)
+		if signals is None:
+			return
+		receivers = signals.get(signal)
+		if receivers is None or receivers:
+			return
+		del signals[signal]
+		if not signals:
+			del self.connections[senderkey]
+			self.senders.pop(senderkey, None)
+
+def _newReceivers():
+	"""Return an empty, ordered receiver dictionary"""
+	if OrderedDict is None:
+		return {}
+	return OrderedDict()
@@ -4,7 +4,17 @@ Provides a function "call", which can sort out
 what arguments a given callable object can take,
 and subset the given arguments to match only
 those which are acceptable.
+
+Internal attributes:
+	methodSignatures -- { im_func : (names, acceptable, takesAll) }
+	functionSignatures -- { receiver : (names, acceptable, takesAll) }
+		caches for signature, see there.  They only hold
+		weak references, so they go away with the functions.
 """
+import weakref
+
+methodSignatures = weakref.WeakKeyDictionary()
+functionSignatures = weakref.WeakKeyDictionary()
 
 def function( receiver ):
 	"""Get function-like callable object for given receiver
@@ -26,24 +36,79 @@ def function( receiver ):
 		raise ValueError('unknown reciever type %s %s'%(receiver, type(receiver)))
 	return receiver, receiver.func_code, 0
 
+def signature( receiver ):
+	"""Get the argument signature of receiver, with caching
+
+	returns (names, acceptable, takesAll)
+
+	names -- tuple of the names of the arguments which may be
+		passed to receiver, not counting a bound first argument
+	acceptable -- the same names as a frozenset, or None if
+		receiver has a **kwds parameter
+	takesAll -- true if receiver has a **kwds parameter
+
+	The result is cached by the underlying function object
+	(im_func for methods), so the code object is only looked
+	at once per function rather than once per call.  Methods
+	and functions are cached separately, since the same
+	function has one more argument when it isn't bound.
+	Receivers which can't be weakly referenced aren't cached.
+	"""
+	im_func = getattr(receiver, 'im_func', None)
+	if im_func is not None:
+		cache, key = methodSignatures, im_func
+	else:
+		cache, key = functionSignatures, receiver
+	try:
+		return cache[key]
+	except (KeyError, TypeError):
+		pass
+	receiver, codeObject, startIndex = function( receiver )
+	names = codeObject.co_varnames[startIndex:codeObject.co_argcount]
+	takesAll = bool(codeObject.co_flags & 8)
+	if takesAll:
+		acceptable = None
+	else:
+		acceptable = frozenset(names)
+	result = (names, acceptable, takesAll)
+	try:
+		cache[key] = result
+	except TypeError:
+		pass
+	return result
+
 def robustApply(receiver, *arguments, **named):
 	"""Call receiver with arguments and an appropriate subset of named
 	"""
-	receiver, codeObject, startIndex = function( receiver )
-	acceptable = codeObject.co_varnames[startIndex+len(arguments):codeObject.co_argcount]
-	for name in codeObject.co_varnames[startIndex:startIndex+len(arguments)]:
-		if named.has_key( name ):
-			raise TypeError(
-				"""Argument %r specified both positionally and as a keyword for calling %r"""% (
-					name, receiver,
+	names, acceptable, takesAll = signature( receiver )
+	if arguments:
+		for name in names[:len(arguments)]:
+			if named.has_key( name ):
+				raise TypeError(
+					"""Argument %r specified both positionally and as a keyword for calling %r"""% (
+						name, receiver,
+					)
 				)
-			)
-	if not (codeObject.co_flags & 8):
-		# fc does not have a **kwds type parameter, therefore 
+		if not takesAll:
+			acceptable = frozenset(names[len(arguments):])
+	if not takesAll:
+		# receiver does not have a **kwds type parameter, therefore
 		# remove unacceptable arguments.
 		for arg in named.keys():
 			if arg not in acceptable:
 				del named[arg]
 	return receiver(*arguments, **named)
 
-			
\ No newline at end of file
+def subset(named, acceptable):
+	"""Get a copy of named with only the acceptable names
+
+	acceptable -- as returned by signature; if None, named
+		itself is returned
+	"""
+	if acceptable is None:
+		return named
+	result = named.copy()
+	for arg in named:
+		if arg not in acceptable:
+			del result[arg]
+	return result
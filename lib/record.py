@@ -0,0 +1,224 @@
+"""This is home to the game record format.
+
+A record is everything needed to replay a game: the board size, who
+went first, and the moves.  There are two encodings.
+
+The binary encoding is a header, HEADER_FORMAT, holding MAGIC, VERSION,
+the board size, the first player (see PLAYER_CODES), and the number of
+moves, followed by one byte per move.  Each byte is the square's bit
+number, as in ``model.Rules.xyz_to_bit``, so boards up to 6 wide fit.
+An archive is just records, one after the other.
+
+The text encoding is one game per line: the board size, the first
+player, and then the moves as ``x,y,z``, separated by spaces, e.g.::
+
+  3 X 1,1,0 0,0,0 2,2,0
+
+Blank lines and lines starting with "#" are ignored.
+
+The readers and writers work on iterators of records, one record at a
+time, so they can stream archives of any size.  For instance, to turn a
+binary archive into text::
+
+  write_text(open('games.txt', 'w'), read_binary(open('games.bin', 'rb')))
+
+"""
+
+import struct
+
+from bitboard import get_moves
+from model import RED, BLUE, MIN_SIZE, MAX_SIZE, Game, get_rules
+
+__docformat__ = 'restructuredtext'
+
+MAGIC = 'T3GR'
+VERSION = 1
+HEADER_FORMAT = '<4sBBBH'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+PLAYER_CODES = {RED: 0, BLUE: 1}
+PLAYERS = {0: RED, 1: BLUE}
+MAX_BIT = 255
+
+
+class Record:
+
+    """This is a game record.
+
+    The following attributes are used:
+
+    size
+      This is the width of the board.
+
+    first_player
+      This is RED or BLUE.
+
+    moves
+      This is a list of the bits that were played, in order.
+
+    """
+
+    def __init__(self, size, first_player, moves=None):
+        """Just save the arguments."""
+        self.size = size
+        self.first_player = first_player
+        self.moves = list(moves or [])
+
+    def __repr__(self):
+        """Return the text encoding."""
+        return encode_text(self)
+
+    def __eq__(self, other):
+        """Compare the size, first player, and moves."""
+        return (isinstance(other, Record) and
+                (self.size, self.first_player, self.moves) ==
+                (other.size, other.first_player, other.moves))
+
+    def __ne__(self, other):
+        """This is the opposite of __eq__."""
+        return not self == other
+
+    @classmethod
+    def from_game(cls, game):
+        """Return a record of a model.Game or bitboard.BitGame.
+
+        Raise a ValueError if the game's history doesn't go back to the
+        start.
+
+        """
+        moves = get_moves(game)
+        if moves is None:
+            raise ValueError("The game's history is incomplete")
+        return cls(game.size, game.first_player, moves)
+
+
+def replay(record, move_count=None, game_class=Game):
+    """Rebuild the game from a record, and return it.
+
+    move_count
+      If not None, only replay this many moves.
+
+    game_class
+      This is model.Game or bitboard.BitGame.
+
+    Raise a ValueError if any of the moves is illegal.
+
+    """
+    game = game_class(record.first_player, record.size)
+    rules = game.rules
+    moves = record.moves
+    if move_count is not None:
+        moves = moves[:move_count]
+    for bit in moves:
+        if not 0 <= bit < rules.total_squares:
+            raise ValueError('No such square: %s' % bit)
+        game.move(rules.bit_to_xyz(bit))
+    return game
+
+
+def check_size(size):
+    """Raise a ValueError unless a record can have this board size."""
+    if not MIN_SIZE <= size <= MAX_SIZE:
+        raise ValueError('Bad board size: %s' % size)
+
+
+def encode_binary(record):
+    """Return the binary encoding of a record."""
+    if record.size ** 3 - 1 > MAX_BIT:
+        raise ValueError('The board is too big: %s' % record.size)
+    return (struct.pack(HEADER_FORMAT, MAGIC, VERSION, record.size,
+                        PLAYER_CODES[record.first_player],
+                        len(record.moves)) +
+            str(bytearray(record.moves)))
+
+
+def write_binary(f, records):
+    """Write records to a file opened in binary mode.
+
+    Return how many were written.
+
+    """
+    count = 0
+    for record in records:
+        f.write(encode_binary(record))
+        count += 1
+    return count
+
+
+def read_binary(f):
+    """Generate the records in a file opened in binary mode.
+
+    Raise a ValueError if the file is corrupt or truncated.
+
+    """
+    while True:
+        header = f.read(HEADER_SIZE)
+        if not header:
+            return
+        if len(header) < HEADER_SIZE:
+            raise ValueError('Truncated record header')
+        (magic, version, size, player_code, count) = struct.unpack(
+            HEADER_FORMAT, header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a game record')
+        if player_code not in PLAYERS:
+            raise ValueError('Bad first player: %s' % player_code)
+        check_size(size)
+        moves = f.read(count)
+        if len(moves) < count:
+            raise ValueError('Truncated record')
+        yield Record(size, PLAYERS[player_code], bytearray(moves))
+
+
+def encode_text(record):
+    """Return the text encoding of a record, without a newline."""
+    rules = get_rules(record.size)
+    words = [str(record.size), record.first_player]
+    for bit in record.moves:
+        words.append('%s,%s,%s' % rules.bit_to_xyz(bit))
+    return ' '.join(words)
+
+
+def decode_text(line):
+    """Parse the text encoding of a record.
+
+    Raise a ValueError if it's malformed.
+
+    """
+    words = line.split()
+    if len(words) < 2 or words[1] not in PLAYER_CODES:
+        raise ValueError('Not a game record: %r' % line)
+    size = int(words[0])
+    check_size(size)
+    rules = get_rules(size)
+    moves = []
+    for word in words[2:]:
+        xyz = tuple(map(int, word.split(',')))
+        if len(xyz) != 3:
+            raise ValueError('Bad move: %r' % word)
+        for c in xyz:
+            if not 0 <= c < size:
+                raise ValueError('Bad move: %r' % word)
+        moves.append(rules.xyz_to_bit(xyz))
+    return Record(size, words[1], moves)
+
+
+def write_text(f, records):
+    """Write records to a file opened in text mode, one per line.
+
+    Return how many were written.
+
+    """
+    count = 0
+    for record in records:
+        f.write(encode_text(record) + '\n')
+        count += 1
+    return count
+
+
+def read_text(f):
+    """Generate the records in a file opened in text mode."""
+    for line in f:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        yield decode_text(line)
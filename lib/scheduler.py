@@ -1,9 +1,18 @@
 """This is home to the Scheduler class.
 
-There's a singleton instance called "scheduler".
+There's a singleton instance called "scheduler".  It runs on PyGame's
+clock.  To run without real time passing, e.g. to replay animations
+headless, give it a VirtualClock::
+
+  scheduler.clock = VirtualClock()
+  ...
+  scheduler.run_until_idle()
 
 """
 
+from heapq import heapify, heappop, heappush
+from itertools import count
+
 import pygame
 
 __docformat__ = 'restructuredtext'
@@ -19,47 +28,172 @@ class Scheduler:
     The following attributes are used:
 
     waiting
-      This is a list of tuples ``(ticks, callback)``.  I could
-      get fancy with keeping the list in order like a kernel does, but
-      it's just not worth the effort at this point.
+      This is a heap of timers, soonest first.  Each timer is a list of
+      the form ``[ticks, sequence, callback]``.  sequence breaks ties so
+      that timers set for the same tick run in the order they were set.
+      A cancelled timer stays in the heap with its callback set to None
+      until it reaches the top.  The timers themselves are the handles
+      returned by set_timer.
+
+    by_callback
+      This is a dict mapping each callback to a list of its live
+      timers.  It's what lets ``set_timer(0, callback)`` skip scanning
+      the heap.
+
+    cancelled
+      This is the number of cancelled timers still in the heap.  When
+      they make up more than half of it, I rebuild it.
+
+    clock
+      This is a callable that returns the current time in milliseconds.
 
     """
 
-    def __init__(self):
-        """Initialize."""
+    def __init__(self, clock=None):
+        """Initialize.
+
+        clock
+          If None, I'll use ``pygame.time.get_ticks``.
+
+        """
+        if clock is None:
+            clock = pygame.time.get_ticks
+        self.clock = clock
         self.waiting = []
+        self.by_callback = {}
+        self.cancelled = 0
+        self._sequence = count()
 
     def tick(self):
         """You should call this on every frame.
 
-        It'll call the callbacks.
+        It'll call the callbacks.  If nothing is due, this only looks at
+        the top of the heap.  Return how many callbacks were called.
 
         """
-        now = pygame.time.get_ticks()
-        # You can't modify a list you're looping over.
-        to_call = [(ticks, callback)
-                   for (ticks, callback) in self.waiting
-                        if now >= ticks]
-        for (ticks, callback) in to_call: 
-            self.waiting.remove((ticks, callback))
+        waiting = self.waiting
+        if not waiting:
+            return 0
+        now = self.clock()
+        called = 0
+        while waiting and waiting[0][0] <= now:
+            timer = heappop(waiting)
+            callback = timer[2]
+            if callback is None:
+                self.cancelled -= 1
+                continue
+            self._forget(timer)
             callback()
+            called += 1
+        return called
 
     def set_timer(self, milliseconds, callback):
         """Set a timer to call callback once after so many milliseconds.
 
         If milliseconds is set to 0, I'll remove the callback from the
-        queue.
+        queue.  Otherwise, return a handle that can be passed to cancel.
 
         """
         if milliseconds == 0:
-            to_remove = [(ticks_, callback_)
-                         for (ticks_, callback_) in self.waiting
-                             if callback_ == callback]
-            for (ticks_, callback_) in to_remove:
-                self.waiting.remove((ticks_, callback_))
-        else:
-            now = pygame.time.get_ticks()
-            self.waiting.append((now + milliseconds, callback))
+            for timer in self.by_callback.get(callback, [])[:]:
+                self.cancel(timer)
+            return None
+        now = self.clock()
+        timer = [now + milliseconds, self._sequence.next(), callback]
+        heappush(self.waiting, timer)
+        self.by_callback.setdefault(callback, []).append(timer)
+        return timer
+
+    def cancel(self, timer):
+        """Cancel a timer returned by set_timer.
+
+        It's okay if it already ran or was already cancelled.
+
+        """
+        if timer[2] is None or timer not in self.by_callback.get(timer[2],
+                                                                 []):
+            return
+        self._forget(timer)
+        timer[2] = None
+        self.cancelled += 1
+        if self.cancelled * 2 > len(self.waiting):
+            # Compact in place, since tick may be in the middle of
+            # popping from this very list.
+            self.waiting[:] = [timer_ for timer_ in self.waiting
+                               if timer_[2] is not None]
+            heapify(self.waiting)
+            self.cancelled = 0
+
+    def next_deadline(self):
+        """Return the tick when the next timer is due, or None."""
+        waiting = self.waiting
+        while waiting and waiting[0][2] is None:
+            heappop(waiting)
+            self.cancelled -= 1
+        if not waiting:
+            return None
+        return waiting[0][0]
+
+    def run_until_idle(self, until=None):
+        """Fast-forward the clock, calling every timer as it comes due.
+
+        This only works if clock is a VirtualClock.  It stops when there
+        are no timers left, which includes timers set by the callbacks.
+
+        until
+          If not None, don't go past this tick.  This is for callbacks
+          that keep setting new timers forever.
+
+        Return how many callbacks were called.
+
+        """
+        called = 0
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or (until is not None and deadline > until):
+                break
+            if deadline > self.clock():
+                self.clock.advance_to(deadline)
+            called += self.tick()
+        if until is not None and until > self.clock():
+            self.clock.advance_to(until)
+        return called
+
+    def _forget(self, timer):
+        """Remove a timer from by_callback."""
+        callback = timer[2]
+        timers = self.by_callback[callback]
+        for (i, timer_) in enumerate(timers):
+            if timer_ is timer:
+                del timers[i]
+                break
+        if not timers:
+            del self.by_callback[callback]
+
+
+class VirtualClock:
+
+    """This is a clock that only moves when you tell it to.
+
+    Call it to get the current time in milliseconds.
+
+    """
+
+    def __init__(self, ticks=0):
+        """Start at the given tick."""
+        self.ticks = ticks
+
+    def __call__(self):
+        """Return the current time in milliseconds."""
+        return self.ticks
+
+    def advance(self, milliseconds):
+        """Move the clock forward by so many milliseconds."""
+        self.ticks += milliseconds
+
+    def advance_to(self, ticks):
+        """Move the clock forward to the given tick."""
+        self.ticks = max(self.ticks, ticks)
 
 
 scheduler = Scheduler()
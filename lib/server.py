@@ -0,0 +1,402 @@
+"""This is a server for networked play.
+
+One process hosts any number of games at once.  Run it via::
+
+  python run_game.py --serve --port 7173
+
+Python 2 doesn't have asyncio, so this is built on asyncore and
+asynchat, which are the standard library's event loop.  I use poll
+instead of select so that there's no limit of 1024 connections.
+
+Each session is a model.Game plus the connections watching it.  Each
+session has its own pydispatch.hub.SignalHub, and its game sends its
+signals there (see ``model.Game.dispatcher``), so sessions never share
+routing tables, and a session's routes go away with it.
+
+The protocol is JSON, one message per line.  The client sends commands:
+
+``{"cmd": "new", "size": 3}``
+  Start a new game and join it.  size is optional.  It must be
+  from 3 to 6.
+
+``{"cmd": "join", "game": 1}``
+  Join an existing game.
+
+``{"cmd": "move", "xyz": [0, 1, 0]}``
+  Make a move.  Only the player whose turn it is may move.
+
+``{"cmd": "reset"}``
+  Start the game over.
+
+``{"cmd": "leave"}``
+  Leave the game.
+
+``{"cmd": "games"}``
+  List the games.
+
+The server sends events:
+
+``{"event": "joined", "seat": "X", ...}``
+  You joined a game.  The first two connections get the RED and BLUE
+  seats.  Everyone after that just watches, and their seat is null.
+  The rest is the same as for "state".
+
+``{"event": "state", "game": 1, "size": 3, "first_player": "X",
+"moves": [[0, 1, 0], ...], "scores": {...}, "status": [...]}``
+  This is everything needed to rebuild the game.
+
+``{"event": "signal", "signal": "STATUS CHANGED", "signals": [...], ...}``
+  The game sent some signals.  The game batches them (see
+  ``model.Game.begin``), so there's one of these per move or reset:
+  signals lists them all, and signal is the last.  Their named
+  arguments come along, e.g. xyzs_included.
+
+``{"event": "move", "xyz": [0, 1, 0], "player": "X"}``
+  A move was made.  This comes after the signals it caused.
+
+``{"event": "reset", "first_player": "O"}``
+  The game was reset.
+
+``{"event": "games", "games": [{"game": 1, "size": 3, "seats": {...}},
+...]}``
+  This is the answer to "games".
+
+``{"event": "error", "message": "..."}``
+  Your last command didn't work.
+
+"""
+
+import asynchat
+import asyncore
+from itertools import count
+from optparse import OptionParser
+import socket
+import sys
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from model import RED, BLUE, SIZE, MIN_SIZE, MAX_SIZE, Game
+from pydispatch.hub import SignalHub
+
+__docformat__ = 'restructuredtext'
+
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 7173
+MAX_LINE_LENGTH = 4096
+LISTEN_BACKLOG = 128
+
+
+class Session:
+
+    """This is a game and the connections watching it.
+
+    The following attributes are used:
+
+    id
+      This is the number clients use to join.
+
+    hub
+      This is the SignalHub the game sends its signals to.
+
+    game
+      This is the model.Game.
+
+    connections
+      This is a list of the Connections in the session.
+
+    seats
+      This is a dict mapping RED and BLUE to the Connection playing
+      that color, or None.
+
+    """
+
+    def __init__(self, session_id, size=SIZE):
+        """Start a new game."""
+        self.id = session_id
+        self.connections = []
+        self.seats = {RED: None, BLUE: None}
+        self.hub = SignalHub()
+        self.game = Game(size=size, dispatcher=self.hub)
+        self.hub.connect(self.forward, sender=self.game)
+
+    def forward(self, signal, sender, **named):
+        """Forward a signal from the game to everyone."""
+        named['event'] = 'signal'
+        named['signal'] = signal
+        self.broadcast(named)
+
+    def broadcast(self, message):
+        """Send a message to every connection."""
+        for connection in self.connections:
+            connection.send_message(message)
+
+    def describe(self, event='state'):
+        """Return a message with everything needed to rebuild the game."""
+        game = self.game
+        return {
+            'event': event,
+            'game': self.id,
+            'size': game.size,
+            'first_player': game.first_player,
+            'moves': [entry[0] for entry in game.history],
+            'scores': game.scores,
+            'status': [fmt % args for (fmt, args) in game.status],
+        }
+
+    def join(self, connection):
+        """Add a connection, and give it a seat if there's one free."""
+        connection.seat = None
+        for player in (RED, BLUE):
+            if self.seats[player] is None:
+                self.seats[player] = connection
+                connection.seat = player
+                break
+        connection.session = self
+        self.connections.append(connection)
+        self.send_joined(connection)
+
+    def send_joined(self, connection):
+        """Tell a connection the state of the game, and its seat."""
+        message = self.describe('joined')
+        message['seat'] = connection.seat
+        connection.send_message(message)
+
+    def leave(self, connection):
+        """Remove a connection, and free its seat."""
+        self.connections.remove(connection)
+        if connection.seat is not None:
+            self.seats[connection.seat] = None
+        connection.session = None
+        connection.seat = None
+
+    def move(self, connection, xyz):
+        """Let the connection make a move.
+
+        Raise a ValueError if it's not its turn or the move is illegal.
+
+        """
+        player = self.game.current_player
+        if self.game.done or connection.seat != player:
+            raise ValueError("It's not your turn")
+        self.game.move(xyz)
+        self.broadcast({'event': 'move', 'xyz': xyz, 'player': player})
+
+    def reset(self, connection):
+        """Let a player start the game over."""
+        if connection.seat is None:
+            raise ValueError("Only players may reset the game")
+        self.game.reset()
+        self.broadcast({'event': 'reset',
+                        'first_player': self.game.first_player})
+
+
+class Connection(asynchat.async_chat):
+
+    """This is a connection from a client.
+
+    The following attributes are used:
+
+    server
+      This is the Server.
+
+    session
+      This is the Session I'm in, or None.
+
+    seat
+      This is RED, BLUE, or None if I'm just watching.
+
+    closed
+      This is True once I've been closed.  asynchat may still have
+      data to hand me after that, which I ignore.
+
+    """
+
+    def __init__(self, server, sock, map=None):
+        """Start reading lines."""
+        asynchat.async_chat.__init__(self, sock, map)
+        self.server = server
+        self.session = None
+        self.seat = None
+        self.closed = False
+        self.buffer = []
+        self.buffer_length = 0
+        self.set_terminator('\n')
+
+    def collect_incoming_data(self, data):
+        """Buffer data until the end of the line."""
+        if self.closed:
+            return
+        self.buffer.append(data)
+        self.buffer_length += len(data)
+        if self.buffer_length > MAX_LINE_LENGTH:
+            self.handle_close()
+
+    def found_terminator(self):
+        """Handle a line."""
+        if self.closed:
+            return
+        line = ''.join(self.buffer)
+        self.buffer = []
+        self.buffer_length = 0
+        try:
+            message = json.loads(line)
+            self.server.handle_message(self, message)
+        except (ValueError, KeyError, TypeError, OverflowError), e:
+            self.send_message({'event': 'error', 'message': str(e)})
+
+    def send_message(self, message):
+        """Send a message as a line of JSON."""
+        self.push(json.dumps(message) + '\n')
+
+    def handle_close(self):
+        """Leave the session, and close."""
+        if self.closed:
+            return
+        self.closed = True
+        self.buffer = []
+        self.buffer_length = 0
+        self.server.disconnect(self)
+        self.close()
+
+
+class Server(asyncore.dispatcher):
+
+    """This accepts connections and keeps track of the sessions.
+
+    The following attributes are used:
+
+    sessions
+      This is a dict mapping session ids to Sessions.
+
+    address
+      This is the ``(host, port)`` I'm listening on.  It's handy if
+      you ask for port 0.
+
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, map=None):
+        """Start listening."""
+        asyncore.dispatcher.__init__(self, map=map)
+        self.map = map
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind((host, port))
+        self.listen(LISTEN_BACKLOG)
+        self.address = self.socket.getsockname()
+        self.sessions = {}
+        self.session_ids = count(1)
+
+    def handle_accept(self):
+        """Start a Connection."""
+        pair = self.accept()
+        if pair is not None:
+            (sock, address) = pair
+            Connection(self, sock, self.map)
+
+    def handle_message(self, connection, message):
+        """Run a command from a client.
+
+        Raise a ValueError, KeyError, TypeError, or OverflowError if it's
+        bad.  For instance, int raises OverflowError for 1e400.
+
+        """
+        cmd = message['cmd']
+        handler = getattr(self, 'do_%s' % cmd, None)
+        if handler is None:
+            raise ValueError('Unknown command: %s' % cmd)
+        handler(connection, message)
+
+    def disconnect(self, connection):
+        """Take a connection out of its session.
+
+        Sessions are thrown away once everyone has left.
+
+        """
+        session = connection.session
+        if session is None:
+            return
+        session.leave(connection)
+        if not session.connections:
+            del self.sessions[session.id]
+
+    def do_new(self, connection, message):
+        """Start a new game and join it."""
+        size = int(message.get('size', SIZE))
+        if not MIN_SIZE <= size <= MAX_SIZE:
+            raise ValueError('The size must be between %s and %s' %
+                             (MIN_SIZE, MAX_SIZE))
+        self.disconnect(connection)
+        session = Session(self.session_ids.next(), size)
+        self.sessions[session.id] = session
+        session.join(connection)
+
+    def do_join(self, connection, message):
+        """Join an existing game.
+
+        Joining the game you're already in keeps your seat, and just
+        sends the state again.
+
+        """
+        session = self.sessions.get(int(message['game']))
+        if session is None:
+            raise ValueError('No such game: %s' % message['game'])
+        if connection.session is session:
+            session.send_joined(connection)
+            return
+        self.disconnect(connection)
+        session.join(connection)
+
+    def do_leave(self, connection, message):
+        """Leave the game."""
+        self.disconnect(connection)
+
+    def do_move(self, connection, message):
+        """Make a move."""
+        if connection.session is None:
+            raise ValueError("You're not in a game")
+        (x, y, z) = map(int, message['xyz'])
+        connection.session.move(connection, (x, y, z))
+
+    def do_reset(self, connection, message):
+        """Start the game over."""
+        if connection.session is None:
+            raise ValueError("You're not in a game")
+        connection.session.reset(connection)
+
+    def do_games(self, connection, message):
+        """List the games."""
+        games = []
+        for session in self.sessions.values():
+            seats = {}
+            for (player, connection_) in session.seats.items():
+                seats[player] = connection_ is not None
+            games.append({'game': session.id, 'size': session.game.size,
+                          'seats': seats})
+        connection.send_message({'event': 'games', 'games': games})
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Run a Server forever."""
+    Server(host, port)
+    asyncore.loop(use_poll=True)
+
+
+def main(args=None):
+    """Parse the command line and run the server."""
+    parser = OptionParser(usage="%prog --serve [options]")
+    parser.add_option('--serve', action='store_true', help='run the server')
+    parser.add_option('--host', default=DEFAULT_HOST,
+                      help='address to listen on (default: %s)' %
+                           DEFAULT_HOST)
+    parser.add_option('--port', type='int', default=DEFAULT_PORT,
+                      help='port to listen on (default: %s)' % DEFAULT_PORT)
+    (options, args) = parser.parse_args(args)
+    print >> sys.stderr, 'Listening on %s:%s' % (options.host, options.port)
+    serve(options.host, options.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""This is a headless self-play simulator.
+
+It plays lots of games between pluggable policies across a pool of
+processes and streams the results to a JSON Lines file, one game per
+line.  It's useful for balance testing SPECIAL_SQUARES and the point
+values.  Run it via::
+
+  python run_game.py --simulate 1000 --workers 8 --red greedy --blue random
+
+Every game gets its own seed, ``seed + game_number``, which is used for
+picking the first player and by the policies.  Hence, any game can be
+replayed exactly, no matter how many workers there are.
+
+"""
+
+from multiprocessing import Pool, cpu_count
+from optparse import OptionParser
+import random
+import sys
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from bitboard import BitGame
+from model import (RED, BLUE, SIZE, TICTACTOE_VALUE, SPECIAL_TICTACTOE_VALUE,
+                   get_rules)
+from record import Record, write_binary
+from solver import DEFAULT_TABLE_BITS, Solver
+
+__docformat__ = 'restructuredtext'
+
+DEFAULT_SOLVER_DEPTH = 2
+EXACT_SOLVER_SQUARES = 9
+TABLE_BITS_BY_SIZE = {3: 16}    # A 3 wide game uses about 2000 entries.
+CHUNK_SIZE = 16
+
+
+def random_policy(game, rand):
+    """Pick any legal square."""
+    return rand.choice(game.legal_bits())
+
+
+def greedy_policy(game, rand):
+    """Pick the square that scores the most points right now.
+
+    Break ties randomly.
+
+    """
+    player = game.current_player
+    owned = game.owners[player]
+    specials = game.specials[player]
+    lines_by_bit = game.rules.lines_by_bit
+    special = game.rules.special_moves[game.move_count]
+    best_points = -1
+    best_bits = []
+    for bit in game.legal_bits():
+        square = 1 << bit
+        points = 0
+        for line in lines_by_bit[bit]:
+            if special and (specials | square) & line == line:
+                points += SPECIAL_TICTACTOE_VALUE
+            elif (owned | square) & line == line:
+                points += TICTACTOE_VALUE
+        if points > best_points:
+            best_points = points
+            best_bits = [bit]
+        elif points == best_points:
+            best_bits.append(bit)
+    return rand.choice(best_bits)
+
+
+class SolverPolicy:
+
+    """Pick the square the solver likes best.
+
+    Once there are only EXACT_SOLVER_SQUARES left, play perfectly.
+    Before that, look ``depth`` moves ahead.
+
+    """
+
+    def __init__(self, size=SIZE, depth=DEFAULT_SOLVER_DEPTH):
+        self.depth = depth
+        self.solver = get_solver(size)
+
+    def __call__(self, game, rand):
+        depth = self.depth
+        if game.rules.total_squares - game.move_count <= EXACT_SOLVER_SQUARES:
+            depth = None
+        return game.rules.xyz_to_bit(self.solver.best_move(game, depth))
+
+POLICIES = {
+    'random': lambda size: random_policy,
+    'greedy': lambda size: greedy_policy,
+    'solver': SolverPolicy,
+}
+
+
+def get_solver(size):
+    """Return this process's Solver for the given board size, cleared.
+
+    Allocating a transposition table takes longer than clearing one, so
+    each process keeps one Solver per size.  Clearing it means nothing
+    carries over from the games a worker happened to play before.
+
+    """
+    solver = get_solver.cache.get(size)
+    if solver is None:
+        solver = get_solver.cache[size] = Solver(
+            TABLE_BITS_BY_SIZE.get(size, DEFAULT_TABLE_BITS))
+    else:
+        solver.table.clear()
+    return solver
+
+get_solver.cache = {}
+
+
+def get_policies(red, blue, size=SIZE):
+    """Return a dict mapping each player to a new policy.
+
+    Every game gets new policies.  If both players use the same policy,
+    they share it.
+
+    """
+    policies = {}
+    for name in (red, blue):
+        if name not in policies:
+            policies[name] = POLICIES[name](size)
+    return {RED: policies[red], BLUE: policies[blue]}
+
+
+def play_game((game_number, seed, red, blue, size)):
+    """Play one game and return its result as a dict.
+
+    red and blue are policy names.
+
+    """
+    rand = random.Random(seed)
+    game = BitGame(rand.choice([RED, BLUE]), size)
+    policies = get_policies(red, blue, size)
+    moves = []
+    while not game.done:
+        bit = policies[game.current_player](game, rand)
+        game.move_bit(bit)
+        moves.append(list(game.rules.bit_to_xyz(bit)))
+    return {
+        'game': game_number,
+        'seed': seed,
+        'size': size,
+        'first_player': game.first_player,
+        'policies': {RED: red, BLUE: blue},
+        'scores': game.scores,
+        'winner': game.winner,
+        'moves': moves,
+    }
+
+
+def simulate(count, red='random', blue='random', workers=None, seed=0,
+             size=SIZE):
+    """Play count games and generate their results.
+
+    workers
+      This is the number of processes to use.  If None, use every core.
+      If 1, don't bother with a pool.
+
+    Results come out in order, as soon as they're ready.
+
+    """
+    tasks = ((i, seed + i, red, blue, size) for i in xrange(count))
+    if workers is None:
+        workers = cpu_count()
+    if workers == 1:
+        for task in tasks:
+            yield play_game(task)
+        return
+    pool = Pool(workers)
+    try:
+        for result in pool.imap(play_game, tasks, CHUNK_SIZE):
+            yield result
+    finally:
+        pool.terminate()
+
+
+def main(args=None):
+    """Parse the command line and run the simulation."""
+    parser = OptionParser(usage="%prog --simulate N [options]")
+    parser.add_option('--simulate', type='int', metavar='N',
+                      help='play N games')
+    parser.add_option('--workers', type='int', metavar='K',
+                      help='use K processes (default: one per core)')
+    parser.add_option('--red', default='random', choices=POLICIES.keys(),
+                      help='policy for red: %s' % ', '.join(POLICIES))
+    parser.add_option('--blue', default='random', choices=POLICIES.keys(),
+                      help='policy for blue: %s' % ', '.join(POLICIES))
+    parser.add_option('--seed', type='int', default=0,
+                      help='seed for the first game')
+    parser.add_option('--size', type='int', default=SIZE,
+                      help='width of the board (default: %s)' % SIZE)
+    parser.add_option('--output', default='-', metavar='FILE',
+                      help='JSON Lines file to write (default: stdout)')
+    parser.add_option('--record', metavar='FILE',
+                      help='also write the games to a binary record archive')
+    (options, args) = parser.parse_args(args)
+    if options.simulate is None:
+        parser.error('--simulate is required')
+    if options.output == '-':
+        output = sys.stdout
+    else:
+        output = open(options.output, 'w')
+    archive = None
+    if options.record is not None:
+        archive = open(options.record, 'wb')
+    rules = get_rules(options.size)
+    wins = {RED: 0, BLUE: 0, None: 0}
+    for result in simulate(options.simulate, options.red, options.blue,
+                           options.workers, options.seed, options.size):
+        output.write(json.dumps(result) + '\n')
+        if archive is not None:
+            moves = [rules.xyz_to_bit(xyz) for xyz in result['moves']]
+            write_binary(archive, [Record(options.size,
+                                          result['first_player'], moves)])
+        wins[result['winner']] += 1
+    if output is not sys.stdout:
+        output.close()
+    if archive is not None:
+        archive.close()
+    print >> sys.stderr, ('red (%s): %s  blue (%s): %s  ties: %s' %
+                          (options.red, wins[RED], options.blue, wins[BLUE],
+                           wins[None]))
+
+
+if __name__ == '__main__':
+    main()
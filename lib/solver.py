@@ -0,0 +1,269 @@
+"""This is a perfect-play solver for the game.
+
+The value of a position is the final score difference, from the point of
+view of the player whose turn it is, assuming both players play
+perfectly from here on out.  Search is done with alpha-beta (negamax) on
+top of bitboard.BitGame, with a bounded, Zobrist-hashed transposition
+table and move ordering.  The table is keyed by ``canonical_key``, so
+symmetric positions share an entry.
+
+Solving the game from the empty board is far out of reach for a pure
+Python search.  Solving from the last level takes well under a second,
+and a depth-limited search gives a heuristic value from anywhere.
+
+"""
+
+from bitboard import BitGame
+from model import TICTACTOE_VALUE, SPECIAL_TICTACTOE_VALUE
+
+__docformat__ = 'restructuredtext'
+
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+INFINITY = 1000000
+DEFAULT_TABLE_BITS = 20
+
+
+def get_static_order(rules):
+    """Return a tuple mapping each bit to its static move-ordering weight.
+
+    Squares on more winning paths are tried first.  It's only calculated
+    once per board size.
+
+    """
+    if rules.size not in get_static_order.cache:
+        weights = [0] * rules.total_squares
+        for path in rules.winning_paths:
+            for xyz in path:
+                weights[rules.xyz_to_bit(xyz)] += 1
+        get_static_order.cache[rules.size] = tuple(weights)
+    return get_static_order.cache[rules.size]
+
+get_static_order.cache = {}
+
+
+class TranspositionTable:
+
+    """This is a bounded cache of search results.
+
+    It has ``2 ** bits`` slots, and each slot has two entries.  The
+    first is depth-preferred: it's only replaced by results of at least
+    the same depth.  The second always holds the most recent result
+    that didn't make it into the first.  That way, expensive results
+    near the root survive while recent results near the leaves still
+    get cached.
+
+    Entries are tuples of the form ``(key, depth, flag, value, bit)``.
+    flag is one of EXACT, LOWER_BOUND, or UPPER_BOUND.  bit is the best
+    move found, or None.  It's stored as seen through the symmetry that
+    produced the canonical key.
+
+    """
+
+    def __init__(self, bits=DEFAULT_TABLE_BITS):
+        """Allocate the table."""
+        self.mask = (1 << bits) - 1
+        self.clear()
+
+    def clear(self):
+        """Forget everything."""
+        size = self.mask + 1
+        self.deep = [None] * size
+        self.recent = [None] * size
+
+    def get(self, key):
+        """Return the entry for key, or None."""
+        index = key & self.mask
+        entry = self.deep[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        entry = self.recent[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def put(self, key, depth, flag, value, bit):
+        """Store a search result."""
+        index = key & self.mask
+        entry = (key, depth, flag, value, bit)
+        deep = self.deep[index]
+        if deep is None or deep[0] == key or deep[1] <= depth:
+            self.deep[index] = entry
+        else:
+            self.recent[index] = entry
+
+
+class Solver:
+
+    """This computes the value of positions under perfect play.
+
+    The following attributes are used:
+
+    table
+      This is the TranspositionTable.  It's kept between calls to
+      solve, so analyzing many related positions gets cheaper as you
+      go.
+
+    nodes
+      This counts how many positions were searched by the last call to
+      solve.
+
+    """
+
+    def __init__(self, table_bits=DEFAULT_TABLE_BITS):
+        """Setup the transposition table.
+
+        table_bits
+          The table has ``2 ** table_bits`` slots.
+
+        """
+        self.table = TranspositionTable(table_bits)
+        self.nodes = 0
+
+    def solve(self, game, depth=None):
+        """Return ``(value, xyz)`` for the given position.
+
+        game
+          This is either a model.Game or a bitboard.BitGame.  It's left
+          as it was.
+
+        depth
+          If None, search to the end of the game, so the value is exact.
+          Otherwise, only look this many moves ahead, and assume that
+          nothing more will be scored after that.
+
+        value is the final score difference, current player minus the
+        other player.  It includes the points that have already been
+        earned.  xyz is the best move, or None if the game is done.
+
+        """
+        if not isinstance(game, BitGame):
+            game = BitGame.from_game(game)
+        player = game.current_player
+        earned = (game.scores[player] -
+                  game.scores[game.other_player(player)])
+        remaining = game.rules.total_squares - game.move_count
+        if depth is None or depth > remaining:
+            depth = remaining
+        self.game = game
+        self.nodes = 0
+        value = 0
+        # Iterative deepening fills the table with good move ordering
+        # for the deeper searches.
+        for i in range(1, depth + 1):
+            value = self._search(i, -INFINITY, INFINITY)
+        del self.game
+        xyz = None
+        keys = game.keys
+        key = min(keys)
+        entry = self.table.get(key)
+        if entry is not None and entry[4] is not None:
+            symmetry = game.rules.inverse_symmetries[keys.index(key)]
+            xyz = game.rules.bit_to_xyz(symmetry[entry[4]])
+        return (earned + value, xyz)
+
+    def best_move(self, game, depth=None):
+        """Return the best move, ``(x, y, z)``, for the current player."""
+        return self.solve(game, depth)[1]
+
+    def _search(self, depth, alpha, beta):
+        """Return the value of the points still to be earned.
+
+        This is from the current player's point of view.
+
+        """
+        self.nodes += 1
+        game = self.game
+        rules = game.rules
+        if depth == 0 or game.move_count == rules.total_squares:
+            return 0
+        keys = game.keys
+        key = min(keys)
+        frame = keys.index(key)
+        entry = self.table.get(key)
+        tt_bit = None
+        if entry is not None:
+            (key_, entry_depth, flag, value, tt_bit) = entry
+            if tt_bit is not None:
+                tt_bit = rules.inverse_symmetries[frame][tt_bit]
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value
+                elif flag == LOWER_BOUND:
+                    if value > alpha:
+                        alpha = value
+                elif value < beta:
+                    beta = value
+                if alpha >= beta:
+                    return value
+        original_alpha = alpha
+        best_value = -INFINITY
+        best_bit = None
+        for bit in self._order_moves(tt_bit):
+            points_earned = game.move_bit(bit)
+            value = points_earned - self._search(depth - 1,
+                                                 points_earned - beta,
+                                                 points_earned - alpha)
+            game.undo()
+            if value > best_value:
+                best_value = value
+                best_bit = bit
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+        if best_value <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_value >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        if best_bit is not None:
+            best_bit = rules.symmetries[frame][best_bit]
+        self.table.put(key, depth, flag, best_value, best_bit)
+        return best_value
+
+    def _order_moves(self, tt_bit):
+        """Return the legal bits, most promising first.
+
+        The best move from the transposition table comes first.  Then
+        come moves that score or that block the other player from
+        scoring, and then squares that are on the most winning paths.
+
+        """
+        game = self.game
+        player = game.current_player
+        other = game.other_player(player)
+        lines_by_bit = game.rules.lines_by_bit
+        static_order = get_static_order(game.rules)
+        special = game.rules.special_moves[game.move_count]
+        rated = []
+        for bit in game.legal_bits():
+            if bit == tt_bit:
+                continue
+            square = 1 << bit
+            gain = 0
+            for (owned, specials) in (
+                    (game.owners[player], game.specials[player]),
+                    (game.owners[other], game.specials[other])):
+                owned |= square
+                if special:
+                    specials |= square
+                for line in lines_by_bit[bit]:
+                    if specials & line == line:
+                        gain += SPECIAL_TICTACTOE_VALUE
+                    elif owned & line == line:
+                        gain += TICTACTOE_VALUE
+            rated.append((gain, static_order[bit], bit))
+        rated.sort()
+        rated.reverse()
+        bits = [bit for (gain, weight, bit) in rated]
+        if tt_bit is not None:
+            bits.insert(0, tt_bit)
+        return bits
+
+
+def solve(game, depth=None):
+    """This is a shortcut for ``Solver().solve(game, depth)``."""
+    return Solver().solve(game, depth)
@@ -6,6 +6,8 @@ positions of everything on the board.
 
 """
 
+from collections import OrderedDict
+
 import pygame
 from pygame.locals import *
 
@@ -44,6 +46,43 @@ LEFT = 0
 TOP = 1
 MAX_SHOWABLE_STATUS_LINES = 3
 ANIMATED_PAUSE = 400
+RENDER_CACHE_SIZE = 256
+
+
+def get_font(size=DEFAULT_FONT_SIZE):
+    """Return the default font at the given size.
+
+    Each size is only loaded once, and it's shared by everyone.
+
+    """
+    if size not in get_font.cache:
+        get_font.cache[size] = pygame.font.Font(None, size)
+    return get_font.cache[size]
+
+get_font.cache = {}
+
+
+def render_text(text, size=DEFAULT_FONT_SIZE, color=DEFAULT_FONT_COLOR,
+                antialias=ANTIALIASED):
+    """Render text using the default font, and return the surface.
+
+    I keep the last RENDER_CACHE_SIZE surfaces around, keyed by all the
+    arguments, and throw out the least recently used one when I need
+    room.  The surfaces are shared, so don't draw on them.
+
+    """
+    key = (text, size, color, antialias)
+    cache = render_text.cache
+    try:
+        image = cache.pop(key)
+    except KeyError:
+        image = get_font(size).render(text, antialias, color)
+        if len(cache) >= RENDER_CACHE_SIZE:
+            cache.popitem(last=False)
+    cache[key] = image
+    return image
+
+render_text.cache = OrderedDict()
 
 
 class Board(pygame.sprite.OrderedUpdates):
@@ -97,9 +136,10 @@ class Square(pygame.sprite.Sprite):
                                              invert(y) * Y_OFFSET_BOTTOM))
         self.rect.left = (BOARD_OFFSET_LEFT + invert(y) * Y_OFFSET_LEFT +
                           x * X_OFFSET_LEFT)
-        dispatcher.connect(self.handle_board_changed, 'BOARD CHANGED')
+        dispatcher.connect(self.handle_square_changed, 'SQUARE CHANGED',
+                           square_model)
 
-    def handle_board_changed(self):
+    def handle_square_changed(self):
         """Am I special or not?"""
         name = self.square_model.special and 'special' or 'normal'
         # This is pretty much a NULL operation unless name has changed.
@@ -130,26 +170,27 @@ class Ball(pygame.sprite.Sprite):
         self.rect = self.image.get_rect()
         self.rect.bottom = square_view.rect.bottom - BALL_OFFSET_BOTTOM
         self.rect.left = square_view.rect.left + BALL_OFFSET_LEFT
-        dispatcher.connect(self.handle_board_changed, signal='BOARD CHANGED')
-        dispatcher.connect(self.handle_score_changed, signal='SCORE CHANGED')
+        dispatcher.connect(self.handle_square_changed,
+                           signal='SQUARE CHANGED', sender=square_model)
+        dispatcher.connect(self.handle_square_scored,
+                           signal='SQUARE SCORED', sender=square_model)
 
-    def handle_board_changed(self):
-        """Update based on changes to the board."""
+    def handle_square_changed(self):
+        """Update based on changes to my square."""
         if self.square_model.value == BLANK and self.alive():
             self.remove(self.board)
         elif self.square_model.value != BLANK and not self.alive():
             self.add(self.board)
             self.fix_color()
 
-    def handle_score_changed(self, xyzs_included=[]):
-        """Highlight the balls involved.
+    def handle_square_scored(self):
+        """Highlight me, since I'm part of a tic-tac-toe.
 
-        We can assume they're already setup.
+        We can assume I'm already setup.
 
         """
-        if self.square_model.xyz in xyzs_included:
-            self.image = load_image('green_ball.png')
-            scheduler.set_timer(ANIMATED_PAUSE, self.fix_color)
+        self.image = load_image('green_ball.png')
+        scheduler.set_timer(ANIMATED_PAUSE, self.fix_color)
 
     def fix_color(self):
         """Set the color to whatever it's supposed to be."""
@@ -221,8 +262,8 @@ class SmartLabel(pygame.sprite.Sprite):
       Just in case you need to get values out of it.  This base class
       doesn't use it.
 
-    font
-      I'll setup a default font.
+    text
+      This is the text that's currently drawn.
 
     signals_to_listen_for
       By default, this is ().
@@ -238,7 +279,6 @@ class SmartLabel(pygame.sprite.Sprite):
         """Grab the args, setup the signals, etc."""
         pygame.sprite.Sprite.__init__(self)
         self.game_model = game_model
-        self.font = pygame.font.Font(None, DEFAULT_FONT_SIZE)
         for signal in self.signals_to_listen_for:
             dispatcher.connect(self.handle_signal, signal=signal)
         self.default_text = default_text
@@ -248,10 +288,12 @@ class SmartLabel(pygame.sprite.Sprite):
         """Respond to the signal.
 
         Feel free to override this and actually make use of the signal,
-        etc.
+        etc.  If the text hasn't changed, I don't redraw it.
 
         """
-        self.draw_text(self.calc_text())
+        text = self.calc_text()
+        if text != self.text:
+            self.draw_text(text)
 
     def calc_text(self):
         """What text should we write?"""
@@ -259,7 +301,8 @@ class SmartLabel(pygame.sprite.Sprite):
 
     def draw_text(self, text):
         """Draw the text."""
-        self.image = self.font.render(text, ANTIALIASED, DEFAULT_FONT_COLOR)
+        self.text = text
+        self.image = render_text(text)
         # Don't lose the topleft, *if* it has one.
         orig_rect = getattr(self, "rect", None)
         self.rect = self.image.get_rect()
@@ -5,5 +5,16 @@ import os
 libdir = os.path.join(os.path.dirname(__file__), 'lib')
 sys.path.insert(0, libdir)
 
-import main
-main.main()
+if '--simulate' in sys.argv[1:]:
+    # This is headless, so don't even import pygame.
+    import simulate
+    simulate.main(sys.argv[1:])
+elif '--bench' in sys.argv[1:]:
+    import bench
+    bench.main(sys.argv[1:])
+elif '--serve' in sys.argv[1:]:
+    import server
+    server.main(sys.argv[1:])
+else:
+    import main
+    main.main()
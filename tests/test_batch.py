@@ -0,0 +1,74 @@
+"""Test that BatchGame matches model.Game exactly.
+
+Run this from the top of the project::
+
+  python -m unittest discover tests
+
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'lib'))
+
+from model import Game
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+else:
+    import batch
+
+__docformat__ = 'restructuredtext'
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class BatchGameTest(unittest.TestCase):
+
+    def check_replay(self, count, size, seed):
+        """Play random batch games, and replay each through model.Game."""
+        games = batch.BatchGame(count, random_state=numpy.random.RandomState(
+            seed), size=size)
+        points = []
+        while not games.done:
+            points.append(games.move(games.random_moves()))
+        winners = games.winners
+        for i in xrange(count):
+            first_player = batch.PLAYERS[games.first_players[i]]
+            game = Game(first_player, size)
+            rules = game.rules
+            for (bits, points_) in zip(games.history, points):
+                player = game.current_player
+                before = game.scores[player]
+                game.move(rules.bit_to_xyz(bits[i]))
+                self.assertEqual(game.scores[player] - before, points_[i])
+            self.assertEqual(
+                (game.scores[batch.RED], game.scores[batch.BLUE]),
+                tuple(games.scores[i]))
+            self.assertEqual(game.winner or batch.BLANK,
+                             batch.PLAYERS[winners[i]])
+            for (xyz, square) in game.board.items():
+                cell = games.boards[i, rules.xyz_to_bit(xyz)]
+                self.assertEqual(square.value,
+                                 batch.PLAYERS[cell & batch.OWNER_BITS])
+                self.assertEqual(square.special,
+                                 bool(cell & batch.SPECIAL_FLAG))
+
+    def test_size_3(self):
+        self.check_replay(300, 3, 0)
+
+    def test_size_4(self):
+        self.check_replay(20, 4, 1)
+
+    def test_bad_moves(self):
+        games = batch.BatchGame(2, first_players=[batch.RED, batch.BLUE])
+        self.assertRaises(ValueError, games.move, [0, 9])
+        games.move([0, 1])
+        self.assertRaises(ValueError, games.move, [0, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
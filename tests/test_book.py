@@ -0,0 +1,76 @@
+"""Test opening book files.
+
+Run this from the top of the project::
+
+  python -m unittest discover tests
+
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'lib'))
+
+from book import Book, build_book, write_book
+from model import RED, Game
+
+__docformat__ = 'restructuredtext'
+
+
+class BookTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dirname, 'book.dat')
+        self.records = build_book(depth=1, search_depth=1)
+        write_book(self.filename, self.records, 1, 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def rewrite(self, data):
+        f = open(self.filename, 'wb')
+        try:
+            f.write(data)
+        finally:
+            f.close()
+
+    def read(self):
+        f = open(self.filename, 'rb')
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def test_lookup(self):
+        book = Book(self.filename)
+        try:
+            self.assertEqual(len(book), len(self.records))
+            (value, xyz) = book.lookup(Game(RED))
+            self.assertNotEqual(xyz, None)
+        finally:
+            book.close()
+
+    def test_truncated(self):
+        self.rewrite(self.read()[:-1])
+        self.assertRaises(ValueError, Book, self.filename)
+
+    def test_too_long(self):
+        self.rewrite(self.read() + '\0')
+        self.assertRaises(ValueError, Book, self.filename)
+
+    def test_not_a_book(self):
+        self.rewrite('XXXX' + self.read()[4:])
+        self.assertRaises(ValueError, Book, self.filename)
+
+    def test_empty(self):
+        self.rewrite('')
+        self.assertRaises(ValueError, Book, self.filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
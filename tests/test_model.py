@@ -0,0 +1,98 @@
+"""Test model.Game.
+
+Run this from the top of the project::
+
+  python -m unittest discover tests
+
+"""
+
+import copy
+import os
+import pickle
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'lib'))
+
+from model import RED, BLUE, BLANK, Game
+from pydispatch import dispatcher
+
+__docformat__ = 'restructuredtext'
+
+
+def play(game, count, rand):
+    """Make count random legal moves, and return their xyzs."""
+    xyzs = []
+    for i in xrange(count):
+        level = game.current_level
+        xyz = rand.choice([xyz for xyz in game.iter_xyz()
+                           if xyz[2] == level and
+                           game.board[xyz].value == BLANK])
+        game.move(xyz)
+        xyzs.append(xyz)
+    return xyzs
+
+
+class CopyTest(unittest.TestCase):
+
+    def test_deepcopy_mid_game(self):
+        game = Game(RED)
+        play(game, 10, random.Random(0))
+        before = repr(game)
+        clone = copy.deepcopy(game)
+        self.assertEqual(repr(clone), before)
+        self.assertEqual(clone.scores, game.scores)
+        self.assertEqual(clone.keys, game.keys)
+        self.assert_(clone.dispatcher is dispatcher)
+        play(clone, 5, random.Random(1))
+        self.assertEqual(repr(game), before)
+        self.assertEqual(game.move_count, 10)
+        self.assertEqual(clone.move_count, 15)
+
+    def test_pickle(self):
+        game = Game(RED)
+        play(game, 4, random.Random(2))
+        clone = pickle.loads(pickle.dumps(game, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(repr(clone), repr(game))
+        self.assertEqual(clone.canonical_key, game.canonical_key)
+
+
+def get_state(game):
+    """Return everything about a game that undo has to restore."""
+    return (repr(game), dict(game.scores), dict(game.owners),
+            dict(game.specials), list(game.keys), list(game.status),
+            game.move_count, game.current_player, game.canonical_key,
+            [(square.value, square.special)
+             for (xyz, square) in sorted(game.board.items())])
+
+
+class UndoTest(unittest.TestCase):
+
+    def test_undo_every_move(self):
+        for seed in xrange(20):
+            rand = random.Random(seed)
+            game = Game(rand.choice([RED, BLUE]))
+            states = [get_state(game)]
+            while not game.done:
+                play(game, 1, rand)
+                states.append(get_state(game))
+            # Undo and redo each move from the end, then undo it all.
+            xyzs = [entry[0] for entry in game.history]
+            for xyz in reversed(xyzs):
+                after = states.pop()
+                game.undo()
+                self.assertEqual(get_state(game), states[-1])
+                game.move(xyz)
+                self.assertEqual(get_state(game), after)
+                game.undo()
+                self.assertEqual(get_state(game), states[-1])
+            self.assertEqual(game.history, [])
+
+    def test_nothing_to_undo(self):
+        self.assertRaises(IndexError, Game(RED).undo)
+
+
+if __name__ == '__main__':
+    unittest.main()
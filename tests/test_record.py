@@ -0,0 +1,96 @@
+"""Test the game record format.
+
+Run this from the top of the project::
+
+  python -m unittest discover tests
+
+"""
+
+import os
+import random
+from StringIO import StringIO
+import struct
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'lib'))
+
+from bitboard import BitGame
+from model import RED, BLUE, BLANK, Game
+import record
+from record import Record
+
+__docformat__ = 'restructuredtext'
+
+
+def play_game(size, rand, move_count=None):
+    """Return a model.Game with random moves, to the end by default."""
+    game = Game(rand.choice([RED, BLUE]), size)
+    if move_count is None:
+        move_count = game.rules.total_squares
+    for i in xrange(move_count):
+        level = game.current_level
+        game.move(rand.choice([xyz for xyz in game.iter_xyz()
+                               if xyz[2] == level and
+                               game.board[xyz].value == BLANK]))
+    return game
+
+
+class RecordTest(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(0)
+        self.games = [play_game(3, rand) for i in xrange(50)]
+        self.games.append(play_game(3, rand, 5))
+        self.games.append(play_game(3, rand, 0))
+        self.games.append(play_game(6, rand))
+        self.records = [Record.from_game(game) for game in self.games]
+
+    def test_replay(self):
+        for (game, record_) in zip(self.games, self.records):
+            for game_class in (Game, BitGame):
+                replayed = record.replay(record_, game_class=game_class)
+                self.assertEqual(replayed.scores, game.scores)
+                self.assertEqual(replayed.move_count, game.move_count)
+            self.assertEqual(repr(record.replay(record_)), repr(game))
+
+    def test_text_round_trip(self):
+        f = StringIO()
+        self.assertEqual(record.write_text(f, self.records),
+                         len(self.records))
+        f = StringIO('# A comment\n\n' + f.getvalue())
+        self.assertEqual(list(record.read_text(f)), self.records)
+
+    def test_binary_round_trip(self):
+        f = StringIO()
+        self.assertEqual(record.write_binary(f, self.records),
+                         len(self.records))
+        data = f.getvalue()
+        self.assertEqual(list(record.read_binary(StringIO(data))),
+                         self.records)
+        for end in (1, record.HEADER_SIZE, len(data) - 1):
+            self.assertRaises(ValueError, list,
+                              record.read_binary(StringIO(data[:end])))
+
+    def test_bad_text(self):
+        for line in ('3 X 3,0,0', '3 X -1,1,0', '3 X 1,1', '3 Q 1,1,0',
+                     '2 X 0,0,0', '7 X 0,0,0', '3'):
+            self.assertRaises(ValueError, record.decode_text, line)
+
+    def test_bad_binary(self):
+        for (magic, size, player_code) in (('XXXX', 3, 0),
+                                           (record.MAGIC, 9, 0),
+                                           (record.MAGIC, 3, 2)):
+            data = struct.pack(record.HEADER_FORMAT, magic, record.VERSION,
+                               size, player_code, 0)
+            self.assertRaises(ValueError, list,
+                              record.read_binary(StringIO(data)))
+
+    def test_illegal_move(self):
+        self.assertRaises(ValueError, record.replay, Record(3, RED, [0, 0]))
+        self.assertRaises(ValueError, record.replay, Record(3, RED, [27]))
+
+
+if __name__ == '__main__':
+    unittest.main()
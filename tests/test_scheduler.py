@@ -0,0 +1,88 @@
+"""Test the Scheduler, using a VirtualClock.
+
+Run this from the top of the project::
+
+  python -m unittest discover tests
+
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'lib'))
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+from scheduler import Scheduler, VirtualClock
+
+__docformat__ = 'restructuredtext'
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.scheduler = Scheduler(self.clock)
+        self.calls = []
+
+    def record(self, name):
+        """Return a callback that records that it was called."""
+        def callback():
+            self.calls.append(name)
+        return callback
+
+    def test_order(self):
+        self.scheduler.set_timer(20, self.record('b'))
+        self.scheduler.set_timer(10, self.record('a'))
+        self.scheduler.set_timer(20, self.record('c'))
+        self.assertEqual(self.scheduler.run_until_idle(), 3)
+        self.assertEqual(self.calls, ['a', 'b', 'c'])
+
+    def test_cancel(self):
+        timer = self.scheduler.set_timer(10, self.record('a'))
+        self.scheduler.set_timer(20, self.record('b'))
+        self.scheduler.cancel(timer)
+        self.scheduler.cancel(timer)
+        self.scheduler.run_until_idle()
+        self.assertEqual(self.calls, ['b'])
+
+    def test_cancel_inside_callback(self):
+        """Cancelling most of the heap from a callback must not upset tick.
+
+        Cancelling x and y rebuilds the heap while tick is still popping
+        from it.  a must run exactly once, and x and y not at all.
+
+        """
+        scheduler = self.scheduler
+        later = []
+
+        def canceller():
+            self.calls.append('canceller')
+            for timer in later:
+                scheduler.cancel(timer)
+
+        scheduler.set_timer(10, canceller)
+        scheduler.set_timer(10, self.record('a'))
+        later.append(scheduler.set_timer(50, self.record('x')))
+        later.append(scheduler.set_timer(60, self.record('y')))
+        self.clock.advance(10)
+        self.assertEqual(scheduler.tick(), 2)
+        self.clock.advance(100)
+        self.assertEqual(scheduler.tick(), 0)
+        self.assertEqual(self.calls, ['canceller', 'a'])
+        self.assertEqual(scheduler.waiting, [])
+        self.assertEqual(scheduler.by_callback, {})
+        self.assertEqual(scheduler.cancelled, 0)
+
+    def test_remove_callback(self):
+        callback = self.record('a')
+        self.scheduler.set_timer(10, callback)
+        self.scheduler.set_timer(20, callback)
+        self.scheduler.set_timer(0, callback)
+        self.assertEqual(self.scheduler.run_until_idle(), 0)
+        self.assertEqual(self.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
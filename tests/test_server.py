@@ -0,0 +1,209 @@
+"""Test the Server over localhost.
+
+The server runs on its own socket map, and the clients are plain
+sockets.  Instead of a thread, I pump asyncore whenever a client is
+waiting for a message.
+
+Run this from the top of the project::
+
+  python -m unittest discover tests
+
+"""
+
+import asyncore
+import json
+import os
+import Queue
+import socket
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'lib'))
+
+from client import RemoteGame
+from model import RED, BLUE, Game
+import server
+
+__docformat__ = 'restructuredtext'
+
+TIMEOUT = 5.0
+
+
+class Client:
+
+    """This is a blocking client that pumps the server while it waits."""
+
+    def __init__(self, test):
+        self.test = test
+        self.socket = socket.create_connection(test.server.address)
+        self.socket.setblocking(False)
+        self.data = ''
+
+    def send(self, message):
+        """Send a message, which may be a dict or a raw line."""
+        if isinstance(message, dict):
+            message = json.dumps(message)
+        self.socket.sendall(message + '\n')
+
+    def recv(self):
+        """Return the next message, or None if the server hung up."""
+        deadline = time.time() + TIMEOUT
+        while '\n' not in self.data:
+            if time.time() > deadline:
+                self.test.fail('Timed out waiting for the server')
+            self.test.pump()
+            try:
+                data = self.socket.recv(4096)
+            except socket.error:
+                continue
+            if not data:
+                return None
+            self.data += data
+        (line, self.data) = self.data.split('\n', 1)
+        return json.loads(line)
+
+    def until(self, event):
+        """Skip messages until one for the given event."""
+        while True:
+            message = self.recv()
+            self.test.assertNotEqual(message, None)
+            if message['event'] == event:
+                return message
+
+    def close(self):
+        self.socket.close()
+
+
+class ServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.map = {}
+        self.server = server.Server('localhost', 0, self.map)
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        for dispatcher in self.map.values():
+            dispatcher.close()
+
+    def pump(self):
+        asyncore.loop(timeout=0.01, count=1, map=self.map)
+
+    def connect(self):
+        client = Client(self)
+        self.clients.append(client)
+        return client
+
+    def games(self, client):
+        client.send({'cmd': 'games'})
+        return client.until('games')['games']
+
+    def start(self):
+        """Start a game with two players, and return them by seat."""
+        red = self.connect()
+        red.send({'cmd': 'new'})
+        joined = red.until('joined')
+        self.assertEqual(joined['seat'], RED)
+        blue = self.connect()
+        blue.send({'cmd': 'join', 'game': joined['game']})
+        self.assertEqual(blue.until('joined')['seat'], BLUE)
+        return {RED: red, BLUE: blue, 'game': joined['game'],
+                'first_player': joined['first_player']}
+
+    def test_join_and_move(self):
+        players = self.start()
+        first = players['first_player']
+        other = first == RED and BLUE or RED
+        players[other].send({'cmd': 'move', 'xyz': [1, 1, 0]})
+        self.assertEqual(players[other].until('error')['message'],
+                         "It's not your turn")
+        players[first].send({'cmd': 'move', 'xyz': [1, 1, 0]})
+        for player in (RED, BLUE):
+            move = players[player].until('move')
+            self.assertEqual(move['xyz'], [1, 1, 0])
+            self.assertEqual(move['player'], first)
+        players[other].send({'cmd': 'move', 'xyz': [1, 1, 0]})
+        self.assertEqual(players[other].until('error')['message'],
+                         'Square taken')
+
+    def test_watcher(self):
+        players = self.start()
+        watcher = self.connect()
+        watcher.send({'cmd': 'join', 'game': players['game']})
+        self.assertEqual(watcher.until('joined')['seat'], None)
+        watcher.send({'cmd': 'move', 'xyz': [0, 0, 0]})
+        self.assertEqual(watcher.until('error')['message'],
+                         "It's not your turn")
+
+    def test_errors(self):
+        client = self.connect()
+        for message in ({'cmd': 'fly'}, {'cmd': 'join', 'game': 99},
+                        {'cmd': 'new', 'size': 40}, {'cmd': 'new', 'size': 2},
+                        {'cmd': 'move', 'xyz': [0, 0, 0]}, 'not json',
+                        '{"cmd": "new", "size": 1e400}',
+                        '{"cmd": "join", "game": 1e400}'):
+            client.send(message)
+            self.assertEqual(client.recv()['event'], 'error')
+        client.send({'cmd': 'new'})
+        client.until('joined')
+        client.send('{"cmd": "move", "xyz": [1e400, 0, 0]}')
+        self.assertEqual(client.recv()['event'], 'error')
+
+    def test_rejoin_own_game(self):
+        client = self.connect()
+        client.send({'cmd': 'new'})
+        joined = client.until('joined')
+        client.send({'cmd': 'join', 'game': joined['game']})
+        self.assertEqual(client.until('joined')['seat'], RED)
+        games = self.games(client)
+        self.assertEqual([game['game'] for game in games], [joined['game']])
+        self.assertEqual(games[0]['seats'], {RED: True, BLUE: False})
+
+    def test_leave(self):
+        players = self.start()
+        players[BLUE].send({'cmd': 'leave'})
+        self.assertEqual(self.games(players[RED])[0]['seats'],
+                         {RED: True, BLUE: False})
+        players[RED].send({'cmd': 'leave'})
+        self.assertEqual(self.games(players[RED]), [])
+
+    def test_hang_up(self):
+        players = self.start()
+        players[BLUE].close()
+        self.clients.remove(players[BLUE])
+        deadline = time.time() + TIMEOUT
+        while (self.server.sessions[players['game']].seats[BLUE] is not None
+               and time.time() < deadline):
+            self.pump()
+        self.assertEqual(self.games(players[RED])[0]['seats'],
+                         {RED: True, BLUE: False})
+
+    def test_client_size_mismatch(self):
+        host = self.connect()
+        host.send({'cmd': 'new', 'size': 4})
+        joined = host.until('joined')
+        messages = Queue.Queue()
+        remote = RemoteGame('localhost', self.server.address[1], Game(RED),
+                            messages.put, joined['game'])
+        deadline = time.time() + TIMEOUT
+        while messages.empty() and time.time() < deadline:
+            self.pump()
+        self.assertRaises(ValueError, remote.handle_message, messages.get())
+        self.assertEqual(remote.game_id, None)
+        while messages.get(timeout=TIMEOUT) is not None:
+            pass
+        self.assertEqual(self.games(host)[0]['seats'],
+                         {RED: True, BLUE: False})
+
+    def test_line_too_long(self):
+        client = self.connect()
+        client.send('a' * (server.MAX_LINE_LENGTH + 1) + '\n{"cmd": "new"}')
+        self.assertEqual(client.recv(), None)
+        self.assertEqual(self.server.sessions, {})
+
+
+if __name__ == '__main__':
+    unittest.main()